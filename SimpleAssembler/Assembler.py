@@ -1,83 +1,590 @@
-import encode, sys
+import argparse, cache, collections, contextlib, encode, io, ir, lexer, os, output, relax, sys, time
 
-if len(sys.argv) < 3:
-    print("Usage: python script.py <input_file>")
-    sys.exit(1)
+# mnemonic -> format (R/I/S/B/J)
+instructions = encode.instructions
 
-input_file = sys.argv[1]
-output_file = sys.argv[2]
 
-instructions = {"add":"R", "sub":"R", "slt":"R", "srl":"R", "or":"R", "and":"R", "xor":"R",
-                "lw":"I", "addi":"I", "jalr":"I",
-                "sw":"S",
-                "beq":"B", "bne":"B", "blt":"B", "bge":"B", "bltu":"B",
-                "jal":"J"
-                }
+def tokenize(source_lines):
+    """
+    Docstring for tokenize
 
-# ---------------------------------------------------------------------------------------------- #
-# STORING LABELS                                                                                 #
-# ---------------------------------------------------------------------------------------------- #
-                                                            
-fr = open(input_file, "r")
-                                                        
-line = fr.readline()
+    - Lazily lexes source lines into (label, instruct) pairs, one line at a time
+    - Blank and comment-only lines are skipped, a label on a line of its own comes out as
+      (label, None) and names the address of the next instruction
+    """
 
-labels = {}
-pc = 0
+    lex = lexer.lex
+    for line in source_lines:
+        label, instruct = lex(line)
+        if label is not None or instruct is not None:
+            yield label, instruct
 
-while line:
-    instruct = line.replace(',', ' ')
-    if ':' in instruct:
-        instruct = line.replace(':', ' ')
-        instruct = instruct.split()
-        labels[instruct[0]] = pc
-    pc += 4
-    line = fr.readline()
 
-fr.close()
+# placeholder for a word whose B/J label has not been defined yet
+PENDING = object()
 
 
+class Assembler:
+    """
+    Docstring for Assembler
 
-# ---------------------------------------------------------------------------------------------- #
-# PARSING INSTRUCTIONS                                                                           #
-# ---------------------------------------------------------------------------------------------- #
+    -> USAGE
 
-fr = open(input_file, "r")
-fw = open(output_file, "w")
+        asm = Assembler()
+        words = asm.assemble(open("prog.s").readlines())
 
-line = fr.readline()
+        - assemble() returns one machine word (int) per instruction in asm.program: one per
+          source instruction, less those -O removes, plus the jal of each relaxed branch;
+          with rvc some of them are 16 bit halves
+        - lines that fail to encode give None, the diagnostic is printed as before
+        - the same object can be reused for any number of programs
+        - after assemble(), asm.program holds the ir.Program of the last source
+        - Assembler(stats=Stats()) times every pass (lex, -O, --schedule, relax, the --rvc
+          layout, encode) into the Stats object; without one, assemble() runs the untimed
+          code and pays nothing for it
+        - Assembler(optimize=True) runs the peephole pass (peephole.optimize) on the program
+          before it is encoded, Assembler(schedule=True) then the scheduler (schedule.schedule)
+        - conditional branches out of reach are relaxed (relax.relax) last, unless the
+          Assembler is made with relax=False; the single-pass paths cannot move code and keep
+          reporting them
+        - Assembler(rvc=True) emits 16 bit encodings where the operands allow (rvc.py): words
+          that are output.Half take 2 bytes, asm.labels and asm.layout hold the compressed pcs
+    """
 
-pc = 0
+    def __init__(self, stats=None, optimize=False, schedule=False, relax=True, rvc=False):
+        self.labels = {}
+        self.stats = stats
+        self.optimize = optimize
+        self.schedule = schedule
+        self.relax = relax
+        self.rvc = rvc
+        self.program = None
+        self.layout = None
 
-while line:
-    instruct = line.replace(',', ' ')
-    if ':' in instruct:
-        instruct = instruct.replace(':', ' ')
-        instruct = instruct.split()[1:]
+    # ------------------------------------------------------------------------------------------ #
+    # STORING LABELS                                                                             #
+    # ------------------------------------------------------------------------------------------ #
+
+    def collect_labels(self, source_lines):
+        # the label pass only needs labels and which lines hold an instruction
+        labels = {}
+        pc = 0
+
+        for label, has_instruct in map(lexer.scan, source_lines):
+            if label is not None:
+                labels[label] = pc
+            if has_instruct:
+                pc += 4
+
+        self.labels = labels
+        return labels
+
+    # ------------------------------------------------------------------------------------------ #
+    # PARSING INSTRUCTIONS                                                                       #
+    # ------------------------------------------------------------------------------------------ #
+
+    def encode_line(self, line, pc):
+        _, instruct = lexer.lex(line)
+        return self.encode_tokens(instruct, pc)
+
+    def encode_tokens(self, instruct, pc):
+        op, rd, rs1, rs2, imm, target, error = ir.fields(instruct)
+        address = ir.NO_TARGET if target is None else self.labels.get(target)
+        return ir.encode_row(op, rd, rs1, rs2, imm, address, error, pc)
+
+    def encode_program(self, program, pc=0):
+        """
+        Docstring for encode_program
+
+        - Generator stage: the rows of an ir.Program in, machine words out
+        - B/J symbols are looked up in self.labels once per distinct name, not once per row
+        - ir.encode_row inlined: R, I and S words are built right here (the same fields as
+          encode.r_type / i_type / s_type), B/J words in reach go straight to encode.b_type /
+          j_type, and only rows with a diagnostic to print take the encode_row call
+        """
+
+        labels = self.labels
+        addresses = [labels.get(name) for name in program.symbols]
+        encode_row = ir.encode_row
+        NO_TARGET = ir.NO_TARGET
+        MNEMONICS = ir.MNEMONICS
+        FORMAT = ir.FORMAT
+        BASE = [encode.BASE[_type] for _type in MNEMONICS]
+        REACH = {fmt: encode.BOUNDS[width] for fmt, width in ir.WIDTH.items()}
+
+        for op, rd, rs1, rs2, imm, target, error in program.rows():
+            fmt = None if error else FORMAT[op]
+            if fmt is not None and target != NO_TARGET:
+                # B/J label: the offset, unless encode_row has to report it undefined or out of reach
+                address = addresses[target]
+                low, high = REACH[fmt]
+                if address is None or not low <= address - pc <= high:
+                    fmt = None
+                else:
+                    imm = address - pc
+
+            if fmt == "R":
+                yield BASE[op] | rs2 << 20 | rs1 << 15 | rd << 7
+            elif fmt == "I":
+                yield BASE[op] | (imm & 0xfff) << 20 | rs1 << 15 | rd << 7
+            elif fmt == "S":
+                imm &= 0xfff
+                yield BASE[op] | (imm >> 5) << 25 | rs2 << 20 | rs1 << 15 | (imm & 0x1f) << 7
+            elif fmt == "B":
+                yield encode.b_type(MNEMONICS[op], rs1, rs2, imm)
+            elif fmt == "J":
+                yield encode.j_type(MNEMONICS[op], rd, imm)
+            else:
+                address = NO_TARGET if target == NO_TARGET else addresses[target]
+                yield encode_row(op, rd, rs1, rs2, imm, address, error, pc)
+            pc += 4
+
+    def encode_stream(self, tokens, pc=0):
+        """
+        Docstring for encode_stream
+
+        - Generator stage: (label, instruct) pairs in, machine words out
+        - Needs the label table to be complete already (see collect_labels)
+        """
+
+        for _, instruct in tokens:
+            if instruct is not None:
+                yield self.encode_tokens(instruct, pc)
+                pc += 4
+
+    def timed(self, phase, run, *args):
+        # run(*args), its time added to self.stats under phase when there is one
+        if self.stats is None:
+            return run(*args)
+        start = time.perf_counter()
+        result = run(*args)
+        self.stats.add_phase(phase, time.perf_counter() - start)
+        return result
+
+    def parse(self, source_lines):
+        # one read of the source gives the labels and the IR, the encode pass only walks columns
+        return self.transform(self.timed("lex", ir.Program().extend, source_lines))
+
+    def transform(self, program):
+        # the passes parse() runs over the IR once it is built (parallel.assemble_chunked builds it in chunks)
+        if self.optimize:
+            import peephole
+            program = self.timed("optimize", peephole.optimize, program)
+        if self.schedule:
+            import schedule
+            program = self.timed("schedule", schedule.schedule, program)
+        if self.relax:
+            program = self.timed("relax", relax.relax, program)
+        self.program = program
+        self.labels = program.labels
+        if self.rvc:
+            # the label pass again, with 2 and 4 byte instructions
+            import rvc
+            self.layout = self.timed("layout", rvc.layout, program)
+            self.labels = self.layout.labels
+        return program
+
+    def encode_parsed(self, program):
+        # the encode pass matching parse(): 4 bytes per row, or the layout --rvc picked
+        if self.rvc:
+            import rvc
+            return rvc.emit(program, self.layout)
+        return self.encode_program(program)
+
+    def assemble(self, source_lines):
+        if self.stats is not None:
+            return self.assemble_timed(source_lines)
+        return list(self.encode_parsed(self.parse(source_lines)))
+
+    def assemble_timed(self, source_lines):
+        """
+        Docstring for assemble_timed
+
+        - Same result as assemble(), recording into self.stats
+            - each pass as its own phase: lex (the IR, label pcs included, they are recorded
+              in the same read), optimize (-O), schedule (--schedule), relax, layout (the
+              --rvc label pass) and encode; parse() records all but encode
+            - every instruction under its format and mnemonic, with its encode time
+        """
+
+        stats = self.stats
+        clock = time.perf_counter
+
+        self.parse(source_lines)
+
+        words = []
+        encoding = 0.0
+        rows = self.encode_parsed(self.program)
+        for op in self.program.op:
+            start = clock()
+            words.append(next(rows))
+            seconds = clock() - start
+            encoding += seconds
+            stats.add_instruction(ir.MNEMONICS[op], ir.FORMAT[op], seconds)
+        stats.add_phase("encode", encoding)
+        return words
+
+    # ------------------------------------------------------------------------------------------ #
+    # SINGLE PASS                                                                                #
+    # ------------------------------------------------------------------------------------------ #
+
+    def forward_reference(self, instruct):
+        """
+        Docstring for forward_reference
+
+        - Returns the label a B/J instruction refers to if that label is not defined yet
+        - Returns None for every other instruction (nothing to patch later)
+        """
+
+        if len(instruct) < 2 or instructions.get(instruct[0]) not in ("B", "J"):
+            return None
+        kind, _, target = instruct[-1]
+        if kind == lexer.IMMEDIATE or target in self.labels:
+            return None
+        return target
+
+    def stream_one_pass(self, tokens):
+        """
+        Docstring for stream_one_pass
+
+        - Reads the source exactly once, so it also works on pipes and stdin
+        - B/J instructions whose label is not defined yet are recorded in a fixup table
+          { label : [(index, instruct, pc), ...] } and encoded as soon as the label shows up
+        - Words are yielded in order as soon as nothing before them is waiting on a fixup,
+          so only the stretch after the oldest unresolved forward reference is held
+        - Fixups still pending at the end are encoded against the final label table
+        """
+
+        self.labels = {}
+        fixups = {}
+        held = collections.deque()
+        base = 0
+        pc = 0
+
+        for label, instruct in tokens:
+            if label is not None:
+                self.labels[label] = pc
+                for index, ref, ref_pc in fixups.pop(label, ()):
+                    held[index - base] = self.encode_tokens(ref, ref_pc)
+            if instruct is None:
+                continue
+
+            target = self.forward_reference(instruct)
+            if target is not None:
+                fixups.setdefault(target, []).append((base + len(held), instruct, pc))
+                held.append(PENDING)
+            else:
+                held.append(self.encode_tokens(instruct, pc))
+            pc += 4
+
+            while held and held[0] is not PENDING:
+                yield held.popleft()
+                base += 1
+
+        for pending in fixups.values():
+            for index, ref, ref_pc in pending:
+                held[index - base] = self.encode_tokens(ref, ref_pc)
+
+        yield from held
+
+    def assemble_one_pass(self, source_lines):
+        return list(self.stream_one_pass(tokenize(source_lines)))
+
+
+def assemble(source_lines):
+    """
+    Docstring for assemble
+
+    - Assembles an iterable of source lines into a list of machine words
+    - Shortcut for Assembler().assemble(source_lines)
+    """
+
+    return Assembler().assemble(source_lines)
+
+
+def assemble_file(input_file, output_file, fmt="text", output_cache=None, stats=None, optimize=False,
+                  analyze=False, schedule=False, relax=True, rvc=False, numpy=False):
+    """
+    Docstring for assemble_file
+
+    - Assembles input_file and writes it to output_file in the given format
+    - With an output_cache, an unchanged source is copied from the cache instead of
+      being encoded again; only outputs without encoding errors are cached
+    - With stats, also records the read and write phases and the bytes read and written
+    - With optimize, runs the peephole pass (-O) before encoding, with schedule the
+      instruction scheduler (--schedule) after it; relax=False leaves out-of-reach branches
+      as errors
+    - With analyze, prints the hazard and cycle report (analysis.py) of the program, even
+      when the output came from the cache
+    - With rvc, emits 16 bit encodings where it can and prints the code size saved, also on
+      a cache hit
+    - With numpy, encodes through vector.assemble(); the output is the same, so it shares
+      the cache entries of the plain encoder. It keeps no Assembler to report from, so
+      numpy with analyze or rvc raises ValueError
+    - Returns the assembled words, or None when the output came from the cache
+    """
+
+    if numpy and (analyze or rvc):
+        raise ValueError("numpy cannot be combined with analyze or rvc")
+
+    start = time.perf_counter()
+    with open(input_file, "rb") as fr:
+        source = fr.read()
+    if stats is not None:
+        stats.add_phase("read", time.perf_counter() - start)
+        stats.bytes_read += len(source)
+
+    if output_cache is not None:
+        key = output_cache.key(source, cache.source_digest(), fmt, optimize, schedule, relax, rvc)
+        data = output_cache.get(key)
+        if data is not None:
+            with output.open_output(output_file) as fw:
+                fw.write(data)
+            if stats is not None:
+                stats.bytes_written += len(data)
+            if analyze or rvc:
+                asm = Assembler(optimize=optimize, schedule=schedule, relax=relax, rvc=rvc)
+                program = asm.parse(io.TextIOWrapper(io.BytesIO(source)))
+                if analyze:
+                    report(program)
+                if rvc:
+                    print(asm.layout.report())
+            return None
+
+    if numpy:
+        import vector
+        words = vector.assemble(io.TextIOWrapper(io.BytesIO(source)), optimize, schedule, relax, stats)
     else:
-        instruct = instruct.split()
-    # print(instruct)
-        
-    if instructions[instruct[0]] == "R":
-        fw.write(encode.r_type(instruct))
-        fw.write('\n')
-
-    elif instructions[instruct[0]] == "I":
-        fw.write(encode.i_type(instruct))
-        fw.write('\n')
-
-    elif instructions[instruct[0]] == "S":
-        fw.write(encode.s_type(instruct))
-        fw.write('\n')
-
-    elif instructions[instruct[0]] == "B":
-        fw.write(encode.b_type(instruct, labels, pc))
-        fw.write('\n')
-        
-    elif instructions[instruct[0]] == "J":
-        fw.write(encode.j_type(instruct, labels, pc))
-        fw.write('\n')
-        
-    pc += 4
-    line = fr.readline()
+        asm = Assembler(stats, optimize, schedule, relax, rvc)
+        words = asm.assemble(io.TextIOWrapper(io.BytesIO(source)))
+
+    start = time.perf_counter()
+    data = output.FORMATS[fmt](words)
+    with output.open_output(output_file) as fw:
+        fw.write(data)
+    if stats is not None:
+        stats.add_phase("write", time.perf_counter() - start)
+        stats.bytes_written += len(data)
+
+    if output_cache is not None and None not in words:
+        output_cache.put(key, data)
+    if analyze:
+        report(asm.program)
+    if rvc:
+        print(asm.layout.report())
+    return words
+
+
+def report(program):
+    import analysis
+    print(analysis.analyze(program).report())
+
+
+def stream(input_file, output_file, fmt="text", buffer_words=4096):
+    """
+    Docstring for stream
+
+    -> PIPELINE
+
+        read lines -> tokenize -> encode -> StreamWriter (bounded buffer)
+
+        - a file is read twice, once for labels and once to encode, so memory use
+          stays at the label table whatever the input size
+        - stdin ('-') can only be read once, so it goes through stream_one_pass
+    """
+
+    asm = Assembler()
+    with output.open_output(output_file) as fw, output.StreamWriter(fw, fmt, buffer_words) as writer:
+        if input_file == "-":
+            words = asm.stream_one_pass(tokenize(sys.stdin))
+            for word in words:
+                writer.write(word)
+            return
+
+        with open(input_file, "r") as fr:
+            asm.collect_labels(fr)
+            fr.seek(0)
+            for word in asm.encode_stream(tokenize(fr)):
+                writer.write(word)
+
+
+def watch(input_file, output_file, fmt="text", interval=0.5, relax=True):
+    """
+    Docstring for watch
+
+    - Polls input_file and, on every change, re-assembles it with an IncrementalAssembler
+      so only the edited lines and the B/J instructions they affect are encoded again
+    - A version with a conditional branch out of reach is relaxed and assembled in full,
+      unless relax is False (--no-relax)
+    - Runs until interrupted (Ctrl-C)
+    """
+
+    import incremental
+
+    inc = incremental.IncrementalAssembler(relax)
+    mtime = None
+    try:
+        while True:
+            current = os.stat(input_file).st_mtime_ns
+            if current != mtime:
+                mtime = current
+                with open(input_file, "r") as fr:
+                    lines = fr.readlines()
+                words = inc.update(lines)
+                output.write(output_file, words, fmt)
+                print(f"re-encoded {inc.reencoded} of {len(words)} lines")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="RISC-V assembler")
+    parser.add_argument("files", nargs="*", metavar="input_file output_file",
+                        help="assembly source and machine code output ('-' for stdin/stdout), "
+                             "or several input/output pairs in batch mode")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="peephole pass before encoding: drop no-ops and branches to the next "
+                             "instruction, fold addi chains, shortcut jumps to jumps")
+    parser.add_argument("--schedule", action="store_true",
+                        help="reorder independent instructions inside basic blocks so a lw result is "
+                             "not used by the next instruction (after -O)")
+    parser.add_argument("--no-relax", dest="relax", action="store_false",
+                        help="report conditional branches out of reach instead of rewriting them into "
+                             "an inverted branch over a jal (--one-pass and --stream never relax, --watch "
+                             "re-assembles in full when it has to)")
+    parser.add_argument("--rvc", action="store_true",
+                        help="emit 16 bit compressed (RVC) encodings where the operands allow and "
+                             "report the code size saved")
+    parser.add_argument("--analyze", action="store_true",
+                        help="print load-use stalls, branch/jump penalties and RAW dependencies, and an "
+                             "estimated cycle count per basic block and label with a hotspot list")
+    parser.add_argument("--one-pass", action="store_true",
+                        help="read the source once, patching forward references (implied for stdin)")
+    parser.add_argument("--format", choices=sorted(output.FORMATS), default="text",
+                        help="text bit-strings (default), raw little-endian bin, $readmemh hex or Intel HEX")
+    parser.add_argument("--jobs", type=int, metavar="N",
+                        help="number of worker processes; splits a single file into chunks, "
+                             "or spreads several input/output pairs across the pool")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="batch mode: read 'input_file output_file' pairs from FILE")
+    parser.add_argument("--stream", action="store_true",
+                        help="constant memory: stream lines through tokenize, encode and a bounded "
+                             "output buffer, keeping only the label table")
+    parser.add_argument("--cache", nargs="?", const=cache.DEFAULT_DIR, metavar="DIR",
+                        help=f"reuse outputs of unchanged sources from DIR (default {cache.DEFAULT_DIR})")
+    parser.add_argument("--cache-size", type=int, default=cache.DEFAULT_SIZE // (1024 * 1024), metavar="MB",
+                        help="evict least recently used cache entries beyond this size")
+    parser.add_argument("--stats", action="store_true",
+                        help="print phase timings, instruction counts, per-mnemonic encode time, "
+                             "bytes read/written, peak memory and cache hit/miss statistics")
+    parser.add_argument("--serve", nargs="?", const="", metavar="SOCKET",
+                        help="run as a daemon answering daemon.py clients on a Unix socket "
+                             "(default $RISCV_ASM_SOCKET or /tmp/riscv-assembler-<uid>.sock)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run under cProfile and dump the pstats data to FILE")
+    parser.add_argument("--numpy", action="store_true",
+                        help="pack instruction fields column-wise with NumPy (pure Python if not installed)")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and re-assemble incrementally whenever the input file changes")
+    parser.add_argument("--chunk-size", type=int, metavar="COUNT",
+                        help="with --jobs and a single file: source lines, then instructions, per worker task")
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        return args
+    if len(args.files) % 2 or (not args.files and not args.manifest):
+        parser.error("expected input_file output_file pairs")
+    # the peephole pass, the analysis and --rvc need the whole program, and batch jobs do not pass them on
+    partial = (args.one_pass or args.stream or args.jobs or args.watch or args.manifest
+               or len(args.files) > 2 or args.files[0] == "-")
+    if (args.optimize or args.schedule) and partial:
+        parser.error("-O and --schedule only work on a single input file, without --one-pass, --stream, "
+                     "--jobs or --watch")
+    if args.analyze and (partial or args.numpy):
+        parser.error("--analyze only works on a single input file, without --one-pass, --stream, --jobs, "
+                     "--watch or --numpy")
+    if args.rvc and (partial or args.numpy):
+        parser.error("--rvc only works on a single input file, without --one-pass, --stream, --jobs, "
+                     "--watch or --numpy")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(run, args)
+        finally:
+            profiler.dump_stats(args.profile)
+    return run(args)
+
+
+def run(args):
+    if args.serve is not None:
+        import daemon
+        return daemon.serve(args.serve or daemon.DEFAULT_SOCKET)
+
+    output_cache = None
+    if args.cache:
+        output_cache = cache.OutputCache(args.cache, args.cache_size * 1024 * 1024)
+
+    if args.manifest or len(args.files) > 2:
+        import parallel
+        jobs = list(zip(args.files[::2], args.files[1::2]))
+        if args.manifest:
+            jobs += parallel.read_manifest(args.manifest)
+        failed = parallel.run_batch(jobs, args.jobs, args.format, output_cache, relax=args.relax)
+        if output_cache is not None:
+            output_cache.evict()
+            if args.stats:
+                print(output_cache.report())
+        return 1 if failed else 0
+
+    input_file, output_file = args.files
+    stats = None
+    if args.stats:
+        from stats import Stats
+        stats = Stats()
+
+    # machine code owns stdout, so diagnostics go to stderr
+    diagnostics = sys.stderr if output_file == "-" else sys.stdout
+    with contextlib.redirect_stdout(diagnostics):
+        if input_file == "-" or args.stream:
+            stream(input_file, output_file, args.format)
+            return 0
+
+        if args.watch:
+            watch(input_file, output_file, args.format, relax=args.relax)
+            return 0
+
+        if args.jobs or args.one_pass:
+            with open(input_file, "r") as fr:
+                if args.jobs:
+                    import parallel
+                    words = parallel.assemble_chunked(fr, args.jobs, args.chunk_size, args.relax)
+                else:
+                    words = Assembler().assemble_one_pass(fr)
+            written = output.write(output_file, words, args.format)
+            if stats is not None:
+                stats.bytes_read += os.path.getsize(input_file)
+                stats.bytes_written += written
+        else:
+            assemble_file(input_file, output_file, args.format, output_cache, stats, args.optimize, args.analyze,
+                          args.schedule, args.relax, args.rvc, args.numpy)
+
+        if stats is not None:
+            print(stats.report())
+        if output_cache is not None:
+            output_cache.evict()
+            if args.stats:
+                print(output_cache.report())
+
+    return 0
+
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import ir
+
+# cycles lost, classic 5-stage pipeline (IF ID EX MEM WB) with full forwarding
+LOAD_USE_STALL = 1      # lw rd ; use of rd -> the value is only there after MEM
+BRANCH_PENALTY = 2      # taken branch, resolved in EX, the 2 fetched after it are flushed
+JAL_PENALTY = 1         # target known in ID
+JALR_PENALTY = 2        # target needs rs1, known in EX
+
+# iterations assumed for each loop level when ranking hotspots, up to MAX_DEPTH levels
+LOOP_WEIGHT = 10
+MAX_DEPTH = 6
+HOTSPOTS = 10
+
+LW = ir.MNEMONIC_ID["lw"]
+JAL = ir.MNEMONIC_ID["jal"]
+JALR = ir.MNEMONIC_ID["jalr"]
+
+# per op id: reads rs1, reads rs2, writes rd, is a B/J instruction
+READS_RS1 = [fmt in ("R", "I", "S", "B") for fmt in ir.FORMAT]
+READS_RS2 = [fmt in ("R", "S", "B") for fmt in ir.FORMAT]
+WRITES_RD = [fmt in ("R", "I", "J") for fmt in ir.FORMAT]
+BRANCH = [fmt in ("B", "J") for fmt in ir.FORMAT]
+
+
+def destinations(program):
+    # index of the instruction each B/J row goes to, None if unknown (undefined label, outside)
+    count = len(program)
+    labels = program.labels
+    dests = [None] * count
+    for index, (op, imm, target, error) in enumerate(zip(program.op, program.imm, program.target, program.error)):
+        if error or not BRANCH[op]:
+            continue
+        if target == ir.NO_TARGET:
+            pc = 4 * index + imm
+        else:
+            pc = labels.get(program.symbols[target])
+        if pc is not None and pc % 4 == 0 and 0 <= pc // 4 <= count:
+            dests[index] = pc // 4
+    return dests
+
+
+def leaders(program, dests):
+    """
+    Docstring for leaders
+
+    - Flags (one per instruction, plus one for the end) for the instructions that start a
+      basic block: the first one, label targets, B/J destinations, and the one after a
+      B/J/jalr
+    """
+
+    count = len(program)
+    leader = [False] * (count + 1)
+    leader[0] = True
+    for pc in program.labels.values():
+        if pc // 4 <= count:
+            leader[pc // 4] = True
+    for index, (op, dest) in enumerate(zip(program.op, dests)):
+        if BRANCH[op] or op == JALR:
+            leader[index + 1] = True
+        if dest is not None:
+            leader[dest] = True
+    return leader
+
+
+class Analysis:
+    """
+    Docstring for Analysis
+
+    -> COLLECTED (analyze() fills it in one pass over the program)
+
+        - cycles        estimated cycles per instruction, 1 + stall + penalty
+        - blocks        [start, end, cycles, stalls, penalty, depth] per basic block
+        - labels        { label : (index, cycles up to the next label) }
+        - load_use, raw, branch_penalty, jump_penalty   totals over the program
+
+    -> MODEL (static, every instruction issues once)
+
+        lw rd ; next reads rd               + LOAD_USE_STALL
+        x rd ; next reads rd (not lw)       RAW, forwarded, counted but free
+        B backward (a loop)                 + BRANCH_PENALTY, assumed taken
+        B forward                           free, assumed not taken
+        jal / jalr                          + JAL_PENALTY / JALR_PENALTY
+
+        - depth is the number of backward B/"jal zero" ranges an instruction is inside
+    """
+
+    def __init__(self, program):
+        self.program = program
+        self.cycles = []
+        self.blocks = []
+        self.labels = {}
+        self.load_use = 0
+        self.raw = 0
+        self.branch_penalty = 0
+        self.jump_penalty = 0
+
+    def total(self):
+        return sum(self.cycles)
+
+    @staticmethod
+    def weight(block):
+        return block[2] * LOOP_WEIGHT ** min(block[5], MAX_DEPTH)
+
+    def hotspots(self, count=HOTSPOTS):
+        # blocks with the most cycles, weighted by how deep in loops they are
+        import heapq
+        return heapq.nlargest(count, self.blocks, key=self.weight)
+
+    def report(self):
+        count = len(self.program)
+        total = self.total()
+        lines = [f"cycles: {total} estimated for {count} instructions"
+                 + (f" (CPI {total / count:.2f})" if count else "")]
+        lines.append(f"  load-use stalls  {self.load_use:10d} x {LOAD_USE_STALL} cycle")
+        lines.append(f"  RAW (forwarded)  {self.raw:10d}")
+        lines.append(f"  branch penalty   {self.branch_penalty:10d} cycles")
+        lines.append(f"  jump penalty     {self.jump_penalty:10d} cycles")
+
+        # label of each block start, in one pass over the labels
+        names = {}
+        for name, (index, _) in self.labels.items():
+            names.setdefault(index, name)
+
+        lines.append("blocks:")
+        lines.append(f"  {'pc':<10} {'label':<16} {'instrs':>7} {'cycles':>8} {'stalls':>7} {'penalty':>8} {'depth':>6}")
+        for start, end, cycles, stalls, penalty, depth in self.blocks:
+            lines.append(f"  {4 * start:#010x} {names.get(start, ''):<16} {end - start:7d} {cycles:8d} "
+                         f"{stalls:7d} {penalty:8d} {depth:6d}")
+
+        lines.append("labels:")
+        for name, (index, cycles) in self.labels.items():
+            lines.append(f"  {name:<16} {4 * index:#010x} {cycles:8d}")
+
+        lines.append(f"hotspots (cycles x {LOOP_WEIGHT}^depth, depth up to {MAX_DEPTH}):")
+        for block in self.hotspots():
+            start, end, cycles, stalls, penalty, depth = block
+            lines.append(f"  {4 * start:#010x} {names.get(start, ''):<16} {self.weight(block):10d} "
+                         f"({cycles} cycles, depth {depth}, source line {self.program.line[start] + 1})")
+        return '\n'.join(lines)
+
+
+def analyze(program):
+    """
+    Docstring for analyze
+
+    - Estimates the cycles an ir.Program takes on the pipeline described in Analysis
+    - Linear in the program size: one pass for the branch destinations, one for leaders
+      and loop depth (a difference array over the backward branch ranges), one for the
+      hazards and the blocks
+    """
+
+    result = Analysis(program)
+    count = len(program)
+    dests = destinations(program)
+    op, rd, rs1, rs2, error = program.op, program.rd, program.rs1, program.rs2, program.error
+
+    leader = leaders(program, dests)
+    depth = [0] * (count + 1)
+    for index, dest in enumerate(dests):
+        if dest is not None and dest <= index and (ir.FORMAT[op[index]] == "B" or rd[index] == 0):
+            depth[dest] += 1
+            depth[index + 1] -= 1
+    for index in range(1, count + 1):
+        depth[index] += depth[index - 1]
+
+    cycles = result.cycles
+    block = None
+    for index in range(count):
+        if leader[index]:
+            block = [index, index, 0, 0, 0, depth[index]]
+            result.blocks.append(block)
+
+        stall = penalty = 0
+        current = op[index]
+        if not error[index]:
+            previous = index - 1
+            # the previous instruction falls through into this one
+            if previous >= 0 and not error[previous] and op[previous] not in (JAL, JALR) and WRITES_RD[op[previous]]:
+                written = rd[previous]
+                if written and ((READS_RS1[current] and rs1[index] == written)
+                                or (READS_RS2[current] and rs2[index] == written)):
+                    if op[previous] == LW:
+                        stall = LOAD_USE_STALL
+                        result.load_use += 1
+                    else:
+                        result.raw += 1
+
+            if current == JAL:
+                penalty = JAL_PENALTY
+                result.jump_penalty += penalty
+            elif current == JALR:
+                penalty = JALR_PENALTY
+                result.jump_penalty += penalty
+            elif BRANCH[current] and dests[index] is not None and dests[index] <= index:
+                penalty = BRANCH_PENALTY
+                result.branch_penalty += penalty
+
+        cycles.append(1 + stall + penalty)
+        block[1] = index + 1
+        block[2] += 1 + stall + penalty
+        block[3] += stall
+        block[4] += penalty
+
+    # cycles from each label up to the next one, through a running total per instruction
+    running = [0]
+    for cycle in cycles:
+        running.append(running[-1] + cycle)
+    labelled = [False] * (count + 1)
+    for pc in program.labels.values():
+        labelled[min(pc // 4, count)] = True
+    following = [count] * (count + 1)
+    for index in range(count - 1, -1, -1):
+        following[index] = index + 1 if labelled[index + 1] else following[index + 1]
+    for name, pc in program.labels.items():
+        index = min(pc // 4, count)
+        result.labels[name] = (index, running[following[index]] - running[index])
+
+    return result
@@ -0,0 +1,207 @@
+import argparse, bisect, contextlib, io, json, os, random, subprocess, sys, tempfile, time
+import Assembler, cache, lexer, output, stats
+
+registers = ["zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2", "s0", "s1", "a0", "a1", "a2", "a3", "a4", "a5",
+             "a6", "a7", "s2", "s3", "s4", "s5", "s6", "s7", "s8", "s9", "s10", "s11", "t3", "t4", "t5", "t6"]
+
+mnemonics = {}
+for _type, _format in Assembler.instructions.items():
+    mnemonics.setdefault(_format, []).append(_type)
+
+# default history file, next to the output cache rather than in the working directory
+HISTORY = os.path.join(os.path.dirname(cache.DEFAULT_DIR), "riscv-assembler-bench.json")
+
+# farthest a generated B (J) instruction branches, in instructions, so it always encodes
+B_REACH = 1000
+J_REACH = 100000
+
+
+def parse_mix(text):
+    """
+    Docstring for parse_mix
+
+        "R=4,I=3,S=1,B=1,J=1"  ->  {"R": 4, "I": 3, "S": 1, "B": 1, "J": 1}
+    """
+
+    mix = {}
+    for part in text.split(','):
+        _format, weight = part.split('=')
+        mix[_format.strip().upper()] = float(weight)
+    return mix
+
+
+def generate(lines, mix=None, label_density=0.05, forward=0.5, seed=0):
+    """
+    Docstring for generate
+
+    - Builds a valid program of the given number of lines
+    - mix           relative weight of each instruction format (R/I/S/B/J)
+    - label_density fraction of lines that carry a label
+    - forward       fraction of B/J instructions that branch forward (the rest go back)
+    - B/J instructions target a label in range, or a numeric offset when none is
+    """
+
+    rng = random.Random(seed)
+    mix = mix or {"R": 4, "I": 3, "S": 1, "B": 1, "J": 1}
+    formats = list(mix)
+    weights = [mix[_format] for _format in formats]
+
+    label_at = sorted(rng.sample(range(lines), int(lines * label_density)))
+    names = {index: f"L{n}" for n, index in enumerate(label_at)}
+
+    def target(index, reach):
+        # nearest label in the chosen direction, within reach
+        pos = bisect.bisect_right(label_at, index)
+        if rng.random() < forward:
+            found = label_at[pos] if pos < len(label_at) and label_at[pos] - index < reach else None
+        else:
+            found = label_at[pos - 1] if pos and index - label_at[pos - 1] < reach else None
+        if found is None:
+            return str(4 * rng.randint(-8, 8))
+        return names[found]
+
+    source = []
+    for index in range(lines):
+        _format = rng.choices(formats, weights)[0]
+        _type = rng.choice(mnemonics[_format])
+        rd, rs1, rs2 = (rng.choice(registers) for _ in range(3))
+        imm = rng.randint(-2048, 2047)
+
+        if _format == "R":
+            line = f"{_type} {rd},{rs1},{rs2}"
+        elif _type == "lw":
+            line = f"lw {rd},{imm}({rs1})"
+        elif _format == "I":
+            line = f"{_type} {rd},{rs1},{imm}"
+        elif _format == "S":
+            line = f"sw {rs2},{imm}({rs1})"
+        elif _format == "B":
+            line = f"{_type} {rs1},{rs2},{target(index, B_REACH)}"
+        else:
+            line = f"{_type} {rd},{target(index, J_REACH)}"
+
+        if index in names:
+            line = f"{names[index]}: {line}"
+        source.append(line + "\n")
+
+    return source
+
+
+def run(source, fmt="text", repeat=3):
+    """
+    Docstring for run
+
+    -> PHASES (best of repeat runs, seconds)
+
+        lex         ir.Program.extend, lexing the source into the IR with its labels
+        relax       relax.relax, on by default in assemble()
+        encode      Assembler.encode_parsed over the program's columns
+        write       rendering the words in fmt and writing them to a file
+
+        - lex and relax are the phases Assembler.parse() records into a Stats object, so
+          the run is exactly what assemble() does, split where a regression would show
+        - the lexer's operand memo (lexer.tokens) is emptied before every run, so each run
+          lexes from cold like a fresh process
+    """
+
+    best = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        output_file = os.path.join(tmp, "out")
+        for _ in range(repeat):
+            lexer.tokens.clear()
+            phases = stats.Stats()
+            asm = Assembler.Assembler(phases)
+
+            program = asm.parse(source)
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                words = list(asm.encode_parsed(program))
+            phases.add_phase("encode", time.perf_counter() - start)
+
+            start = time.perf_counter()
+            output.write(output_file, words, fmt)
+            phases.add_phase("write", time.perf_counter() - start)
+
+            times = dict(phases.phases)
+            times["total"] = sum(times.values())
+            for phase, seconds in times.items():
+                best[phase] = min(best.get(phase, seconds), seconds)
+
+    return {phase: {"seconds": seconds, "lines_per_sec": len(source) / seconds if seconds else 0.0}
+            for phase, seconds in best.items()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(entry, previous=None):
+    print(f"{entry['lines']} lines, mix {entry['mix']}, label density {entry['label_density']}, "
+          f"forward {entry['forward']} (commit {entry['commit']})")
+    for phase, result in entry["results"].items():
+        line = f"  {phase:<9} {result['seconds'] * 1000:10.2f} ms  {result['lines_per_sec']:14.0f} lines/s"
+        if previous and phase in previous["results"]:
+            before = previous["results"][phase]["lines_per_sec"]
+            if before:
+                line += f"  ({100.0 * (result['lines_per_sec'] - before) / before:+.1f}% vs {previous['commit']})"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assembler throughput benchmark")
+    parser.add_argument("--lines", type=int, default=100000, help="lines in the generated program")
+    parser.add_argument("--mix", type=parse_mix, default="R=4,I=3,S=1,B=1,J=1",
+                        help="relative weight of each instruction format")
+    parser.add_argument("--label-density", type=float, default=0.05, help="fraction of lines with a label")
+    parser.add_argument("--forward", type=float, default=0.5, help="fraction of forward branches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=sorted(output.FORMATS), default="text")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per phase, the best one is kept")
+    parser.add_argument("--history", default=HISTORY,
+                        help="JSON file the result is appended to and compared with")
+    parser.add_argument("--save-source", metavar="FILE", help="also write the generated program to FILE")
+    args = parser.parse_args(argv)
+
+    source = generate(args.lines, args.mix, args.label_density, args.forward, args.seed)
+    if args.save_source:
+        with open(args.save_source, "w") as fw:
+            fw.writelines(source)
+
+    entry = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "lines": args.lines,
+        "mix": args.mix,
+        "label_density": args.label_density,
+        "forward": args.forward,
+        "seed": args.seed,
+        "format": args.format,
+        "results": run(source, args.format, args.repeat),
+    }
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, "r") as fr:
+            history = json.load(fr)
+
+    # compare against the latest run with the same workload
+    workload = ("lines", "mix", "label_density", "forward", "seed", "format")
+    previous = next((old for old in reversed(history) if all(old.get(key) == entry[key] for key in workload)), None)
+    report(entry, previous)
+
+    history.append(entry)
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, "w") as fw:
+        json.dump(history, fw, indent=1)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import functools, hashlib, os, tempfile
+
+# default cache location, overridable with RISCV_ASM_CACHE
+DEFAULT_DIR = os.environ.get("RISCV_ASM_CACHE",
+                             os.path.join(os.path.expanduser("~"), ".cache", "riscv-assembler"))
+
+DEFAULT_SIZE = 64 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def source_digest(directory=os.path.dirname(os.path.abspath(__file__))):
+    """
+    Docstring for source_digest
+
+    - sha256 of the assembler's *.py files (names and contents), read once per process
+    - Part of every cache key, so editing any module of the assembler invalidates the
+      outputs cached before the edit
+    """
+
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(directory, name), "rb") as fr:
+                digest.update(fr.read())
+    return digest.hexdigest()
+
+
+class OutputCache:
+    """
+    Docstring for OutputCache
+
+    -> LAYOUT
+
+        <directory>/<key[:2]>/<key>      (one file per assembled output)
+
+        - key = sha256 of the assembler sources (source_digest), the output format and
+          options, and the source bytes
+        - a hit refreshes the entry's mtime, so mtime order is LRU order
+        - evict() drops the least recently used entries until the cache fits in max_bytes
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, source, *variant):
+        digest = hashlib.sha256()
+        for part in variant:
+            digest.update(str(part).encode())
+            digest.update(b'\0')
+        digest.update(source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """
+        Docstring for get
+
+        - Returns the cached output bytes for key, or None on a miss
+        """
+
+        path = self.path(key)
+        try:
+            with open(path, "rb") as fr:
+                data = fr.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write then rename, so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as fw:
+            fw.write(data)
+        os.replace(tmp, path)
+
+    def evict(self):
+        if not os.path.isdir(self.directory):
+            return
+
+        entries = []
+        total = 0
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return (f"cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+                f"{self.evictions} evicted")
@@ -0,0 +1,183 @@
+import argparse, base64, json, os, socket, sys
+
+# default socket, overridable with RISCV_ASM_SOCKET
+DEFAULT_SOCKET = os.environ.get("RISCV_ASM_SOCKET", f"/tmp/riscv-assembler-{os.getuid()}.sock")
+
+# seconds a client waits for the server before assembling in its own process
+DEFAULT_TIMEOUT = 10.0
+
+
+def assemble_request(message):
+    """
+    Docstring for assemble_request
+
+    - Assembles one request, returning the response dict
+    - Diagnostics printed by encode.py are captured instead of going to stdout
+    - Never raises: a malformed request, or source the assembler fails on, gives an
+      {"ok": false} response
+    """
+
+    import contextlib, io
+    import Assembler, output
+
+    if not isinstance(message, dict):
+        return {"ok": False, "error": "request is not a JSON object"}
+
+    fmt = message.get("format", "text")
+    if not isinstance(fmt, str) or fmt not in output.FORMATS:
+        return {"ok": False, "error": f"unknown format {fmt}"}
+
+    if "source" in message:
+        source = message["source"]
+        if not isinstance(source, str):
+            return {"ok": False, "error": "source is not a string"}
+    else:
+        # a number would be opened as a file descriptor, the server's own socket among them
+        path = message.get("path")
+        if not isinstance(path, str):
+            return {"ok": False, "error": "request has no source or path"}
+        try:
+            with open(path, "r") as fr:
+                source = fr.read()
+        except (OSError, ValueError) as error:
+            return {"ok": False, "error": str(error)}
+
+    diagnostics = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(diagnostics):
+            words = Assembler.assemble(source.splitlines(keepends=True))
+        data = output.FORMATS[fmt](words)
+    except Exception as error:
+        return {"ok": False, "error": f"{type(error).__name__}: {error}"}
+    return {"ok": True, "output": base64.b64encode(data).decode(), "diagnostics": diagnostics.getvalue()}
+
+
+def serve(socket_path=DEFAULT_SOCKET):
+    """
+    Docstring for serve
+
+    - Listens on a Unix domain socket and answers requests until interrupted (Ctrl-C)
+    - Every connection gets its own thread, so a client that connects and sends nothing
+      holds up no other client; the requests themselves are assembled one at a time (the
+      stdout redirect is process-wide), so captured diagnostics never interleave
+    - Returns 1 without touching the socket when another server is already listening on it
+
+    -> PROTOCOL (one JSON object per line, both ways)
+
+        request     {"source": "<assembly text>", "format": "text"}
+                    {"path": "/abs/prog.s", "format": "bin"}
+
+        response    {"ok": true,  "output": "<base64 machine code>", "diagnostics": "<printed messages>"}
+                    {"ok": false, "error": "<why the request was not assembled>"}
+
+    - the client (request, main) only imports the standard library, so it starts in a few
+      milliseconds; encode and register are imported once, by the server
+    """
+
+    import signal, socketserver, threading
+
+    assembling = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    message = json.loads(line)
+                except ValueError as error:
+                    response = {"ok": False, "error": str(error)}
+                else:
+                    with assembling:
+                        response = assemble_request(message)
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+                self.wfile.flush()
+
+    if listening(socket_path):
+        print(f"a server is already listening on {socket_path}", file=sys.stderr)
+        return 1
+    # a socket left behind by a server that died would make bind() fail
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    # stop the same way on kill as on Ctrl-C, so the socket file is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    import Assembler   # pay for the imports once, before the first request
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+    return 0
+
+
+def listening(socket_path):
+    # whether a live server accepts connections on socket_path (not just a stale socket file)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def request(message, socket_path=DEFAULT_SOCKET, timeout=DEFAULT_TIMEOUT):
+    """
+    Docstring for request
+
+    - Sends one request to the server and returns its response
+    - Falls back to assemble_request() in this process when no server is listening, or
+      when the server does not answer within timeout seconds (None waits for ever)
+    """
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            # socket.timeout is an OSError, so a server that hangs ends in the fallback too
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            with sock.makefile("rwb") as stream:
+                stream.write(json.dumps(message).encode() + b'\n')
+                stream.flush()
+                return json.loads(stream.readline())
+    except (OSError, ValueError):
+        return assemble_request(message)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RISC-V assembler client, talks to Assembler.py --serve")
+    parser.add_argument("input_file", help="assembly source ('-' for stdin)")
+    parser.add_argument("output_file", help="machine code output ('-' for stdout)")
+    parser.add_argument("--format", default="text", help="text (default), bin, hex or ihex")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"server socket (default {DEFAULT_SOCKET})")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help=f"seconds to wait for the server before assembling here (default {DEFAULT_TIMEOUT:g})")
+    args = parser.parse_args(argv)
+
+    if args.input_file == "-":
+        message = {"source": sys.stdin.read(), "format": args.format}
+    else:
+        message = {"path": os.path.abspath(args.input_file), "format": args.format}
+
+    response = request(message, args.socket, args.timeout)
+    if not response["ok"]:
+        print(response["error"], file=sys.stderr)
+        return 1
+
+    # machine code owns stdout, so diagnostics go to stderr
+    diagnostics = sys.stderr if args.output_file == "-" else sys.stdout
+    diagnostics.write(response["diagnostics"])
+
+    data = base64.b64decode(response["output"])
+    if args.output_file == "-":
+        sys.stdout.flush()
+        sys.stdout.buffer.write(data)
+    else:
+        with open(args.output_file, "wb") as fw:
+            fw.write(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,62 @@
-import math
-import register
+opcode = {"add":"0110011", "sub":"0110011", "slt":"0110011", "srl":"0110011", "or":"0110011", "and":"0110011", "xor":"0110011",
+          "lw":"0000011", "addi":"0010011", "jalr":"1100111",
+          "sw":"0100011",
+          "beq":"1100011", "bne":"1100011", "blt":"1100011", "bge":"1100011", "bltu":"1100011", "bgeu":"1100011",
+          "jal":"1101111"}
 
 funct3 = {"add":"000", "sub":"000", "slt":"010", "srl":"101", "or":"110", "and":"111", "xor":"100",
           "lw":"010", "addi":"000", "jalr":"000",
           "sw":"010",
-          "beq":"000", "bne":"001", "blt":"100", "bge":"101", "bltu":"110"}
+          "beq":"000", "bne":"001", "blt":"100", "bge":"101", "bltu":"110", "bgeu":"111"}
 
-def r_type(instruction):
+funct7 = {"sub":"0100000"}
+
+instructions = {"add":"R", "sub":"R", "slt":"R", "srl":"R", "or":"R", "and":"R", "xor":"R",
+                "lw":"I", "addi":"I", "jalr":"I",
+                "sw":"S",
+                "beq":"B", "bne":"B", "blt":"B", "bge":"B", "bltu":"B", "bgeu":"B",
+                "jal":"J"
+                }
+
+# mnemonic -> fixed part of the instruction word (funct7 | funct3 | opcode)
+BASE = {_type: int(funct7.get(_type, "0000000"), 2) << 25
+               | int(funct3.get(_type, "000"), 2) << 12
+               | int(opcode[_type], 2)
+        for _type in opcode}
+
+# immediate width -> (lowest, highest) accepted value
+BOUNDS = {12: (-2048, 2047), 13: (-4096, 4095), 21: (-524288, 524287)}
+
+
+def immediate(imm, width):
+    """
+    Docstring for immediate
+
+    - Returns an immediate (int) as a width bit two's complement field
+    - Returns None (after printing why) if it was not a number (None) or is out of bounds
+    """
+
+    if imm is None:
+        print("Invalid immediate value")
+        return None
+    low, high = BOUNDS[width]
+    if imm < low or imm > high:
+        print("Immediate value out of bounds")
+        return None
+    return imm & ((1 << width) - 1)
+
+
+def to_bits(word):
+    """
+    Docstring for to_bits
+
+    - Text form of an encoded instruction, only used at the output stage
+    """
+
+    return format(word, "032b")
+
+
+def r_type(_type, rd, rs1, rs2):
     """
     Docstring for r_type
 
@@ -39,39 +89,10 @@ def r_type(instruction):
 
     """
 
-    if len(instruction) != 4:
-        print("Invalid instruction format")
-        return ""
-    
-    _type, rd, rs1, rs2 = instruction
-
-    encoding = ["-"] * 6
-
-    # opcode
-    encoding[5] = "0110011"
-
-    # funct7
-    if _type == "sub":
-        encoding[0] = "0100000"
-    else:
-        encoding[0] = "0000000"
+    return BASE[_type] | rs2 << 20 | rs1 << 15 | rd << 7
 
-    # funct3
-    encoding[3] = funct3[_type]
 
-    if rd not in register.mapping or rs1 not in register.mapping or rs2 not in register.mapping:
-        print("Invalid register arguments")
-        return ""
-    
-    # registers
-    encoding[1] = register.mapping[rs2]
-    encoding[2] = register.mapping[rs1]
-    encoding[4] = register.mapping[rd]
-
-    return ''.join(encoding)
-
-
-def i_type(instruction):
+def i_type(_type, rd, rs1, imm):
     """
     Docstring for i_type
 
@@ -94,94 +115,10 @@ def i_type(instruction):
 
     """
 
-    opcode = {"lw":"0000011", "addi":"0010011", "jalr":"1100111"}
-    _type = instruction[0]
-    
-    encoding = ["-"] * 5
-    
-    # opcode
-    encoding[4] = opcode[_type]
-    
-    # funct3
-    encoding[2] = funct3[_type]
-    
-    # lw block
-    if _type == "lw":
-        if len(instruction) != 3:
-            print("Invalid format for lw intruction")
-            return ""
-         
-        rd = instruction[1]
-        imm_rs1 = instruction[2]
-        if '(' not in imm_rs1 or ')' not in imm_rs1:
-            print("Invalid format for lw intruction")
-            return ""
-        ind1 = imm_rs1.index('(')
-        ind2 = imm_rs1.index(')')
-        rs1 = imm_rs1[ind1 + 1:ind2]
-        if rd not in register.mapping or rs1 not in register.mapping:
-            print("Invalid register arguments")
-        
-        imm = imm_rs1[:ind1]
-        if imm[0] == '-':
-            imm = int(imm[1:])
-            if imm > 2048:
-                print("Immediate value out of bounds")
-                return ""
-            l = int(math.log2(imm) + 1)
-            imm = bin((imm ^ ((1 << l) - 1)) + 1)[2:].zfill(l)
-            imm = '1' * (12 - l) + imm
-        else:
-            imm = int(imm)
-            if imm > 2047:
-                print("Immediate value out of bounds")
-                return ""
-            imm = bin(imm)[2:]
-            imm = '0' * (12 - len(imm)) + imm
-        
-        # imm
-        encoding[0] = imm
-        
-        # registers
-        encoding[1] = register.mapping[rs1]
-        encoding[3] = register.mapping[rd]
-        
-    # addi and jalr block
-    elif _type == "addi" or _type == "jalr":
-        if len(instruction) != 4:
-            print(f"Invalid format for {_type} intruction")
-            return ""
-        
-        rd, rs1 = instruction[1], instruction[2]
-        
-        imm = instruction[3]
-        if imm[0] == '-':
-            imm = int(imm[1:])
-            if imm > 2048:
-                print("Immediate value out of bounds")
-                return ""
-            l = int(math.log2(imm) + 1)
-            imm = bin((imm ^ ((1 << l) - 1)) + 1)[2:].zfill(l)
-            imm = '1' * (12 - l) + imm
-        else:
-            imm = int(imm)
-            if imm > 2047:
-                print("Immediate value out of bounds")
-                return ""
-            imm = bin(imm)[2:]
-            imm = '0' * (12 - len(imm)) + imm
-        
-        # imm
-        encoding[0] = imm
-        
-        # registers
-        encoding[1] = register.mapping[rs1]
-        encoding[3] = register.mapping[rd]
-        
-    return ''.join(encoding)
-        
-        
-def s_type(instruction):
+    return BASE[_type] | (imm & 0xfff) << 20 | rs1 << 15 | rd << 7
+
+
+def s_type(_type, rs2, rs1, imm):
     """ 
     Docstring for s_type
 
@@ -201,60 +138,13 @@ def s_type(instruction):
             sw rs2, imm[11:0](rs1)
 
     """
-    
-    if len(instruction) != 3:
-        print("Invalid format for sw intruction")
-        return ""
-    
-    encoding = ['-'] * 6
-    
-    # opcode
-    encoding[5] = "0100011"
-    
-    # funct3
-    encoding[3] = funct3["sw"]
-        
-    rs2 = instruction[1]
-    
-    imm_rs1 = instruction[2]
-    if '(' not in imm_rs1 or ')' not in imm_rs1:
-        print("Invalid format for sw intruction")
-        return ""
-    ind1 = imm_rs1.index('(')
-    ind2 = imm_rs1.index(')')
-    rs1 = imm_rs1[ind1 + 1:ind2]
-    if rs2 not in register.mapping or rs1 not in register.mapping:
-        print("Invalid register arguments")
-    
-    imm = imm_rs1[:ind1]
-    if imm[0] == '-':
-        imm = int(imm[1:])
-        if imm > 2048:
-            print("Immediate value out of bounds")
-            return ""
-        l = int(math.log2(imm) + 1)
-        imm = bin((imm ^ ((1 << l) - 1)) + 1)[2:].zfill(l)
-        imm = '1' * (12 - l) + imm
-    else:
-        imm = int(imm)
-        if imm > 2047:
-            print("Immediate value out of bounds")
-            return ""
-        imm = bin(imm)[2:]
-        imm = '0' * (12 - len(imm)) + imm
-    
-    # imm
-    encoding[0] = imm[:7]
-    encoding[4] = imm[7:]
-    
-    # registers
-    encoding[1] = register.mapping[rs2]
-    encoding[2] = register.mapping[rs1]
-    
-    return ''.join(encoding)
-
-
-def b_type(instruction, labels, pc):
+
+    imm &= 0xfff
+    return (BASE[_type] | (imm >> 5) << 25 | rs2 << 20 | rs1 << 15
+            | (imm & 0x1f) << 7)
+
+
+def b_type(_type, rs1, rs2, imm):
     """
     Docstring for b_type
 
@@ -269,6 +159,7 @@ def b_type(instruction, labels, pc):
         |  imm[12|10:5] |    rs2   |   rs1   |    100    | imm[4:1|11] |  1100011  |     blt     | 
         |  imm[12|10:5] |    rs2   |   rs1   |    101    | imm[4:1|11] |  1100011  |     bge     |   
         |  imm[12|10:5] |    rs2   |   rs1   |    110    | imm[4:1|11] |  1100011  |     bltu    |                                                                                         
+        |  imm[12|10:5] |    rs2   |   rs1   |    111    | imm[4:1|11] |  1100011  |     bgeu    |
         |_______________|__________|_________|___________|_____________|___________|_____________|
 
         - opcode = 1100011
@@ -280,57 +171,18 @@ def b_type(instruction, labels, pc):
             blt rs1, rs2, imm[12:1]
             bge rs1, rs2, imm[12:1]
             bltu rs1, rs2, imm[12:1]
+            bgeu rs1, rs2, imm[12:1]
 
-        - IF arg is LABEL -> we need its address
-        - IF NOT we just use the NUMERIC VALUE
+        - imm is the offset, already checked (labels are resolved in ir.py)
     """
 
-    if len(instruction) != 4:
-        print("Invalid format for B-type intruction")
-        return ""
-    
-    _type, rs1, rs2, imm = instruction
-    
-    encoding = ['-'] * 6
-
-    # opcode
-    encoding[5] = "1100011"
-
-    # funct3
-    encoding[3] = funct3[_type]
-    
-    # label or imm
-    if imm in labels:
-        imm = str(labels[imm] - pc)
-        
-    if imm[0] == '-':
-        imm = int(imm[1:])
-        if imm > 4096:
-            print("Immediate value out of bounds")
-            return ""
-        l = int(math.log2(imm) + 1)
-        imm = bin((imm ^ ((1 << l) - 1)) + 1)[2:].zfill(l)
-        imm = '1' * (13 - l) + imm
-    else:
-        imm = int(imm)
-        if imm > 4095:
-            print("Immediate value out of bounds")
-            return ""
-        imm = bin(imm)[2:]
-        imm = '0' * (13 - len(imm)) + imm
-    
-    # imm
-    encoding[0] = imm[0] + imm[2:8]
-    encoding[4] = imm[8:12] + imm[1]
-    
-    # registers
-    encoding[1] = register.mapping[rs2]
-    encoding[2] = register.mapping[rs1]
-
-    return ''.join(encoding)
-    
-    
-def j_type(instruction, labels, pc):
+    # imm[12|10:5] -> [31:25] , imm[4:1|11] -> [11:7]
+    return (BASE[_type] | (imm >> 12 & 0x1) << 31 | (imm >> 5 & 0x3f) << 25
+            | rs2 << 20 | rs1 << 15
+            | (imm >> 1 & 0xf) << 8 | (imm >> 11 & 0x1) << 7)
+
+
+def j_type(_type, rd, imm):
     """
     Docstring for j_type
 
@@ -347,45 +199,9 @@ def j_type(instruction, labels, pc):
             
             jal rd, imm[20:1]
             
-        - IF arg is LABEL -> we need its address
-        - IF NOT we just use the NUMERIC VALUE
+        - imm is the offset, already checked (labels are resolved in ir.py)
     """
-    
-    if len(instruction) != 3:
-        print("Invalid format for J-type intruction")
-        return ""
-    
-    _, rd, imm = instruction
-    
-    encoding = ['-'] * 3
-    
-    # opcode
-    encoding[2] = "1101111"
-    
-    # label or imm
-    if imm in labels:
-        imm = str(labels[imm] - pc)
-        
-    if imm[0] == '-':
-        imm = int(imm[1:])
-        if imm > 524288:
-            print("Immediate value out of bounds")
-            return ""
-        l = int(math.log2(imm) + 1)
-        imm = bin((imm ^ ((1 << l) - 1)) + 1)[2:].zfill(l)
-        imm = '1' * (21 - l) + imm
-    else:
-        imm = int(imm)
-        if imm > 524287:
-            print("Immediate value out of bounds")
-            return ""
-        imm = bin(imm)[2:]
-        imm = '0' * (21 - len(imm)) + imm
-        
-    # imm
-    encoding[0] = imm[0] + imm[10:20] + imm[9] + imm[1:9]
-    
-    # registers
-    encoding[1] = register.mapping[rd]
-    
-    return ''.join(encoding)
\ No newline at end of file
+
+    # imm[20|10:1|11|19:12] -> [31:12]
+    return (BASE[_type] | (imm >> 20 & 0x1) << 31 | (imm >> 1 & 0x3ff) << 21
+            | (imm >> 11 & 0x1) << 20 | (imm >> 12 & 0xff) << 12 | rd << 7)
@@ -0,0 +1,200 @@
+import bisect, difflib
+import Assembler, encode, lexer
+
+
+class IncrementalAssembler:
+    """
+    Docstring for IncrementalAssembler
+
+    -> USAGE
+
+        inc = IncrementalAssembler()
+        words = inc.assemble(old_lines)
+        words = inc.update(new_lines)        # only re-encodes what the edit affects
+
+    -> STATE KEPT BETWEEN RUNS
+
+        - lines, tokens, pcs, words one entry per source line; a line without an instruction
+                                    has the pc of the next one and no word
+        - labels                    { label : pc } like Assembler.labels
+        - referrers                 { label : {index, ...} } B/J instructions naming the label
+
+    -> WHAT update() RE-ENCODES
+
+        - lines that were edited or inserted
+        - B/J instructions whose (label address - pc) changed, either because the
+          instruction shifted or because the label it names moved
+
+    -> RELAXING
+
+        - a conditional branch out of reach needs a jal after it (relax.py), which one word
+          per line cannot hold; such a version of the program is assembled in full by
+          Assembler, and the next update() starts over with assemble()
+        - relax=False keeps one word per line and reports those branches, like --no-relax
+    """
+
+    def __init__(self, relax=True):
+        self.asm = Assembler.Assembler()
+        self.relax = relax
+        self.lines = []
+        self.tokens = []
+        self.pcs = []
+        self.words = []
+        self.labels = {}
+        self.referrers = {}
+        self.reencoded = 0
+
+    def label_reference(self, instruct):
+        """
+        Docstring for label_reference
+
+        - Returns the label a B/J instruction branches to, None if it is not a label reference
+        """
+
+        if instruct is None or len(instruct) < 2 or Assembler.instructions.get(instruct[0]) not in ("B", "J"):
+            return None
+        kind, _, target = instruct[-1]
+        if kind == lexer.IMMEDIATE:
+            return None
+        return target
+
+    def layout(self, tokens):
+        """
+        Docstring for layout
+
+        - One pass over the lexed lines giving each line's pc and the label table
+        """
+
+        pcs = []
+        labels = {}
+        pc = 0
+        for label, instruct in tokens:
+            pcs.append(pc)
+            if label is not None:
+                labels[label] = pc
+            if instruct is not None:
+                pc += 4
+        return pcs, labels
+
+    def out_of_reach(self, tokens, pcs, labels, referrers):
+        # whether a conditional branch names a label relax.relax() would have to relax
+        if not self.relax:
+            return False
+        low, high = encode.BOUNDS[13]
+        for label, indices in referrers.items():
+            pc = labels.get(label)
+            if pc is None:
+                continue
+            for index in indices:
+                if Assembler.instructions[tokens[index][1][0]] == "B" and not low <= pc - pcs[index] <= high:
+                    return True
+        return False
+
+    def relaxed(self, source_lines):
+        # the whole program through Assembler, relaxed; no per-line state is kept from it
+        words = Assembler.Assembler().assemble(source_lines)
+        self.__init__(self.relax)
+        self.reencoded = len(words)
+        return words
+
+    def result(self):
+        # one word per instruction, like Assembler.assemble()
+        return [word for word, (_, instruct) in zip(self.words, self.tokens) if instruct is not None]
+
+    def assemble(self, source_lines):
+        self.lines = list(source_lines)
+        self.tokens = [lexer.lex(line) for line in self.lines]
+        self.pcs, self.labels = self.layout(self.tokens)
+
+        self.referrers = {}
+        for index, (_, instruct) in enumerate(self.tokens):
+            target = self.label_reference(instruct)
+            if target is not None:
+                self.referrers.setdefault(target, set()).add(index)
+        if self.out_of_reach(self.tokens, self.pcs, self.labels, self.referrers):
+            return self.relaxed(self.lines)
+
+        self.asm.labels = self.labels
+        self.words = [None if instruct is None else self.asm.encode_tokens(instruct, pc)
+                      for (_, instruct), pc in zip(self.tokens, self.pcs)]
+        self.reencoded = sum(instruct is not None for _, instruct in self.tokens)
+        return self.result()
+
+    def update(self, source_lines):
+        if not self.lines:
+            return self.assemble(source_lines)
+        new_lines = list(source_lines)
+        matcher = difflib.SequenceMatcher(None, self.lines, new_lines, autojunk=False)
+
+        tokens = []
+        words = []
+        edited = []
+        blocks = []     # (old start, old end, new start) of every unchanged run of lines
+
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                blocks.append((i1, i2, j1))
+                tokens.extend(self.tokens[i1:i2])
+                words.extend(self.words[i1:i2])
+            else:
+                for line in new_lines[j1:j2]:
+                    edited.append(len(tokens))
+                    tokens.append(lexer.lex(line))
+                    words.append(None)
+
+        block_starts = [block[0] for block in blocks]
+
+        def remap(index):
+            # old line index -> new line index, None if the line was edited away
+            pos = bisect.bisect_right(block_starts, index) - 1
+            if pos < 0:
+                return None
+            i1, i2, j1 = blocks[pos]
+            return index - i1 + j1 if index < i2 else None
+
+        # rescanning the kept tokens is cheap and keeps the last-definition-wins rule
+        pcs, labels = self.layout(tokens)
+
+        # referrers on unchanged lines move with their block
+        referrers = {}
+        origin = {}
+        for label, indices in self.referrers.items():
+            for old_index in indices:
+                index = remap(old_index)
+                if index is not None:
+                    referrers.setdefault(label, set()).add(index)
+                    origin[index] = old_index
+
+        for index in edited:
+            target = self.label_reference(tokens[index][1])
+            if target is not None:
+                referrers.setdefault(target, set()).add(index)
+        if self.out_of_reach(tokens, pcs, labels, referrers):
+            return self.relaxed(new_lines)
+
+        # a B/J needs re-encoding when its offset (label - pc) is not what it was
+        dirty = set(edited)
+        for label, indices in referrers.items():
+            new_pc = labels.get(label)
+            old_pc = self.labels.get(label)
+            for index in indices:
+                if index in dirty:
+                    continue
+                if new_pc is None or old_pc is None or new_pc - pcs[index] != old_pc - self.pcs[origin[index]]:
+                    dirty.add(index)
+
+        self.asm.labels = labels
+        self.reencoded = 0
+        for index in sorted(dirty):
+            instruct = tokens[index][1]
+            if instruct is not None:
+                words[index] = self.asm.encode_tokens(instruct, pcs[index])
+                self.reencoded += 1
+
+        self.lines = new_lines
+        self.tokens = tokens
+        self.pcs = pcs
+        self.words = words
+        self.labels = labels
+        self.referrers = referrers
+        return self.result()
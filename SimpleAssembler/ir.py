@@ -0,0 +1,296 @@
+import array
+import encode, lexer, register
+
+# mnemonic <-> small integer id used in the op column
+MNEMONICS = list(encode.BASE)
+MNEMONIC_ID = {_type: index for index, _type in enumerate(MNEMONICS)}
+FORMAT = [encode.instructions[_type] for _type in MNEMONICS]
+
+# immediate width of the I/S/B/J formats
+WIDTH = {"I": 12, "S": 12, "B": 13, "J": 21}
+
+# number of operands each mnemonic takes
+ARITY = {_type: 2 if _type == "lw" or encode.instructions[_type] in ("S", "J") else 3 for _type in MNEMONICS}
+
+# target column value of an instruction whose immediate is a plain number
+NO_TARGET = -1
+
+LW = MNEMONIC_ID["lw"]
+register_number = register.numbers.get
+
+
+def format_message(_type):
+    fmt = encode.instructions[_type]
+    if fmt == "R":
+        return "Invalid instruction format"
+    if fmt in ("B", "J"):
+        return f"Invalid format for {fmt}-type intruction"
+    return f"Invalid format for {_type} intruction"
+
+
+# error column value -> diagnostic printed when the instruction is encoded, 0 = none
+MESSAGES = [None, "Invalid register arguments", "Invalid immediate value", "Immediate value out of bounds"]
+MESSAGES += dict.fromkeys(map(format_message, MNEMONICS))
+INVALID_REGISTER, INVALID_IMMEDIATE, OUT_OF_BOUNDS = 1, 2, 3
+
+# mnemonic -> error code when its operand count or layout is wrong
+FORMAT_ERROR = {_type: MESSAGES.index(format_message(_type)) for _type in MNEMONICS}
+
+
+# mnemonic -> (op, operand layout, length of the split instruction, lowest and highest immediate)
+R_LAYOUT, I_LAYOUT, MEMORY_LAYOUT, B_LAYOUT, J_LAYOUT = range(5)
+SPEC = {}
+for _type in MNEMONICS:
+    _format = encode.instructions[_type]
+    SPEC[_type] = (MNEMONIC_ID[_type],
+                   MEMORY_LAYOUT if _type == "lw" or _format == "S" else "RI.BJ".index(_format),
+                   ARITY[_type] + 1,
+                   *(encode.BOUNDS[WIDTH[_format]] if _format != "R" else (0, 0)))
+
+
+def row(instruct):
+    """
+    Docstring for row
+
+    - Checks one instruction, its mnemonic followed by the operand texts (lexer.split), and
+      flattens it into its IR row
+
+        ["lw", "a0", "0x10(sp)"]  ->  (op, 10, 2, 0, 16, None, 0)
+
+        (op, rd, rs1, rs2, imm, target, error)
+
+        - target    label name a B/J instruction branches to, None when imm is the offset
+        - error     0, or the MESSAGES entry encoding this row will print; the checks run
+                    in the order encode.py always reported them (format, registers, immediate)
+
+    - Registers are looked up by name, memory operands and immediates converted directly, and
+      only a B/J instruction's last operand goes through the lexer's token memo
+    """
+
+    op, layout, length, low, high = SPEC[instruct[0]]
+    if len(instruct) != length:
+        return op, 0, 0, 0, 0, None, FORMAT_ERROR[instruct[0]]
+
+    reg = register_number
+    rd = rs1 = rs2 = 0
+
+    if layout == R_LAYOUT:
+        rd, rs1, rs2 = reg(instruct[1]), reg(instruct[2]), reg(instruct[3])
+        if rd is None or rs1 is None or rs2 is None:
+            return op, 0, 0, 0, 0, None, INVALID_REGISTER
+        return op, rd, rs1, rs2, 0, None, 0
+
+    if layout == MEMORY_LAYOUT:
+        # lexer.operand()'s MEMORY case, these texts rarely repeat
+        operand = instruct[2]
+        if '(' not in operand or ')' not in operand:
+            return op, 0, 0, 0, 0, None, FORMAT_ERROR[instruct[0]]
+        imm, _, rs1 = operand.partition('(')
+        imm, rs1 = lexer.number(imm), reg(rs1.partition(')')[0])
+        operand = reg(instruct[1])
+        if operand is None or rs1 is None:
+            return op, 0, 0, 0, 0, None, INVALID_REGISTER
+        if op == LW:
+            rd = operand
+        else:
+            rs2 = operand
+
+    elif layout == I_LAYOUT:
+        rd, rs1 = reg(instruct[1]), reg(instruct[2])
+        if rd is None or rs1 is None:
+            return op, 0, 0, 0, 0, None, INVALID_REGISTER
+        imm = lexer.immediate(instruct[3])
+
+    else:
+        if layout == B_LAYOUT:
+            rs1, rs2 = reg(instruct[1]), reg(instruct[2])
+            if rs1 is None or rs2 is None:
+                return op, 0, 0, 0, 0, None, INVALID_REGISTER
+        else:
+            rd = reg(instruct[1])
+            if rd is None:
+                return op, 0, 0, 0, 0, None, INVALID_REGISTER
+
+        # IF arg is LABEL -> resolved to an offset when encoding, IF NOT it is the offset
+        kind, imm, text = lexer.token(instruct[-1])
+        if kind != lexer.IMMEDIATE:
+            return op, rd, rs1, rs2, 0, text, 0
+
+    if imm is None:
+        return op, 0, 0, 0, 0, None, INVALID_IMMEDIATE
+    if imm < low or imm > high:
+        return op, 0, 0, 0, 0, None, OUT_OF_BOUNDS
+    return op, rd, rs1, rs2, imm, None, 0
+
+
+def fields(instruct):
+    """
+    Docstring for fields
+
+    - row() for an instruction lexer.lex() has already lexed: the mnemonic followed by one
+      (kind, value, text) token per operand
+    """
+
+    return row((instruct[0], *[operand[2] for operand in instruct[1:]]))
+
+
+def encode_row(op, rd, rs1, rs2, imm, address, error, pc):
+    """
+    Docstring for encode_row
+
+    - Encodes one IR row at pc, printing its diagnostic and giving None if it has one
+    - address is NO_TARGET when imm is the offset, else the pc of the B/J label (None if
+      the label is not defined)
+    """
+
+    if error:
+        print(MESSAGES[error])
+        return None
+
+    _type = MNEMONICS[op]
+    fmt = FORMAT[op]
+
+    if fmt == "R":
+        return encode.r_type(_type, rd, rs1, rs2)
+
+    elif fmt == "I":
+        return encode.i_type(_type, rd, rs1, imm)
+
+    elif fmt == "S":
+        return encode.s_type(_type, rs2, rs1, imm)
+
+    if address != NO_TARGET:
+        imm = encode.immediate(None if address is None else address - pc, WIDTH[fmt])
+        if imm is None:
+            return None
+
+    if fmt == "B":
+        return encode.b_type(_type, rs1, rs2, imm)
+
+    return encode.j_type(_type, rd, imm)
+
+
+class Program:
+    """
+    Docstring for Program
+
+    -> COLUMNS (one entry per instruction, pc = 4 * index)
+
+        op              array B     mnemonic id, see MNEMONICS
+        rd, rs1, rs2    array B     register numbers
+        imm             array i     immediate, or the B/J offset when target is NO_TARGET
+        target          array i     B/J label reference (index into symbols) or NO_TARGET
+        error           array B     0, or the MESSAGES entry encoding prints for this row
+        line            array I     source line the instruction came from (0-based)
+
+        - 17 bytes per instruction, against a list of strings per line before
+        - labels    { label : pc } of every label defined, last definition wins
+        - symbols   names referenced by B/J instructions, symbol_id the reverse
+    """
+
+    def __init__(self):
+        self.op = array.array("B")
+        self.rd = array.array("B")
+        self.rs1 = array.array("B")
+        self.rs2 = array.array("B")
+        self.imm = array.array("i")
+        self.target = array.array("i")
+        self.error = array.array("B")
+        self.line = array.array("I")
+        self.labels = {}
+        self.symbols = []
+        self.symbol_id = {}
+
+    def __len__(self):
+        return len(self.op)
+
+    def symbol(self, name):
+        index = self.symbol_id.get(name)
+        if index is None:
+            index = self.symbol_id[name] = len(self.symbols)
+            self.symbols.append(name)
+        return index
+
+    def add(self, op, rd, rs1, rs2, imm, target, error, line):
+        # one row as it is, target already a symbol id or NO_TARGET
+        self.op.append(op)
+        self.rd.append(rd)
+        self.rs1.append(rs1)
+        self.rs2.append(rs2)
+        self.imm.append(imm)
+        self.target.append(target)
+        self.error.append(error)
+        self.line.append(line)
+
+    def append(self, instruct, line=0):
+        op, rd, rs1, rs2, imm, target, error = fields(instruct)
+        self.op.append(op)
+        self.rd.append(rd)
+        self.rs1.append(rs1)
+        self.rs2.append(rs2)
+        self.imm.append(imm)
+        self.target.append(NO_TARGET if target is None else self.symbol(target))
+        self.error.append(error)
+        self.line.append(line)
+
+    def extend(self, source_lines, line=0):
+        """
+        Docstring for extend
+
+        - Lexes source lines into the columns, recording labels on the way, so the label
+          pass and the IR come out of a single read of the source
+        - Returns the program, so Program().extend(lines) builds one
+        """
+
+        labels = self.labels
+        # append() inlined, with the column appends bound once for the whole source
+        op, rd, rs1, rs2, imm, target, error, lines = (column.append for column in (
+            self.op, self.rd, self.rs1, self.rs2, self.imm, self.target, self.error, self.line))
+        symbol = self.symbol
+        pc = 4 * len(self.op)
+
+        # lexer.split() inlined, the operand texts go to row() as they are
+        for line, text in enumerate(source_lines, line):
+            if '#' in text:
+                text = text[:text.index('#')]
+            if ':' in text:
+                label, _, text = text.partition(':')
+                label = label.strip()
+                if label:
+                    labels[label] = pc
+            instruct = text.replace(',', ' ').split()
+            if not instruct:
+                continue
+            row_op, row_rd, row_rs1, row_rs2, row_imm, row_target, row_error = row(instruct)
+            op(row_op)
+            rd(row_rd)
+            rs1(row_rs1)
+            rs2(row_rs2)
+            imm(row_imm)
+            target(NO_TARGET if row_target is None else symbol(row_target))
+            error(row_error)
+            lines(line)
+            pc += 4
+        return self
+
+    def concat(self, other):
+        """
+        Docstring for concat
+
+        - Appends the rows of other, a Program built from the source lines that follow this
+          one's, as extend() would have read them: other's label pcs move up by this program's
+          size and its symbols are renumbered into this program's
+        - Returns the program
+        """
+
+        pc = 4 * len(self.op)
+        symbol_ids = [self.symbol(name) for name in other.symbols]
+        for name in ("op", "rd", "rs1", "rs2", "imm", "error", "line"):
+            getattr(self, name).extend(getattr(other, name))
+        self.target.extend([NO_TARGET if target == NO_TARGET else symbol_ids[target] for target in other.target])
+        for label, label_pc in other.labels.items():
+            self.labels[label] = pc + label_pc
+        return self
+
+    def rows(self):
+        return zip(self.op, self.rd, self.rs1, self.rs2, self.imm, self.target, self.error)
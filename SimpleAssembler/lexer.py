@@ -0,0 +1,157 @@
+import re
+import register
+
+# token kinds, every operand is lexed into a (kind, value, text) token
+REGISTER = "register"     # value = register number
+IMMEDIATE = "immediate"   # value = int (decimal, 0x hex or 0b binary)
+MEMORY = "memory"         # value = (imm, rs1), either one None when it is not valid
+SYMBOL = "symbol"         # value = name, a label reference (or a misspelt register)
+INVALID = "invalid"       # value = None
+
+HEX_BIN = re.compile(r"[+-]?0(?:[xX][0-9a-fA-F]+|[bB][01]+)")
+NAME = re.compile(r"[A-Za-z_.$][\w.$]*")
+
+regs = register.numbers
+
+# distinct operand texts remembered by Tokens before it starts over (bounds a long-running daemon)
+MAX_TOKENS = 1 << 18
+
+
+def number(text):
+    """
+    Docstring for number
+
+        "-12" -> -12    "0x1f" -> 31    "0b101" -> 5    "s1" -> None
+    """
+
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    if HEX_BIN.fullmatch(text):
+        return int(text, 0)
+    return None
+
+
+def operand(text):
+    """
+    Docstring for operand
+
+    - Lexes the text of one operand into its (kind, value, text) token
+
+        "s1" -> (REGISTER, 9, "s1")     "-8(sp)" -> (MEMORY, (-8, 2), "-8(sp)")
+        "0x10" -> (IMMEDIATE, 16, ...)  "loop" -> (SYMBOL, "loop", "loop")
+    """
+
+    if text in regs:
+        return REGISTER, regs[text], text
+    if '(' in text and ')' in text:
+        imm, _, rs1 = text.partition('(')
+        return MEMORY, (number(imm), regs.get(rs1.partition(')')[0])), text
+    value = number(text)
+    if value is not None:
+        return IMMEDIATE, value, text
+    if NAME.fullmatch(text):
+        return SYMBOL, text, text
+    return INVALID, None, text
+
+
+def immediate(text):
+    """
+    Docstring for immediate
+
+    - The value of an immediate operand's text, None if it is not an immediate
+    - Plain decimals are converted straight away: most immediates in a program are distinct,
+      so the token memo would mostly miss on them
+    """
+
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    kind, value, _ = token(text)
+    return value if kind == IMMEDIATE else None
+
+
+class Tokens(dict):
+    """
+    Docstring for Tokens
+
+    - operand text -> token, each distinct text is lexed once and then only looked up
+    - registers, common immediates and labels repeat all over a program, so nearly every
+      operand after the first few hundred lines is a single dict lookup
+    """
+
+    def __missing__(self, text):
+        if len(self) >= MAX_TOKENS:
+            self.clear()
+        token = self[text] = operand(text)
+        return token
+
+
+tokens = Tokens()
+token = tokens.__getitem__
+
+
+def scan(line):
+    """
+    Docstring for scan
+
+    - Just the label pass's part of lex(): the line's label (or None) and whether it holds
+      an instruction, without lexing the operands
+    - Agrees with lex() on every line: commas count as blanks, so a line of commas and
+      whitespace holds no instruction
+    """
+
+    if '#' in line:
+        line = line[:line.index('#')]
+
+    label = None
+    if ':' in line:
+        label, _, line = line.partition(':')
+        label = label.strip() or None
+    if ',' in line:
+        line = line.replace(',', ' ')
+    return label, line != "" and not line.isspace()
+
+
+def split(line):
+    """
+    Docstring for split
+
+    - The label (or None) of one source line and its instruction as the mnemonic followed by
+      the operand texts, without lexing the operands; what lex() and ir.row() read
+
+        "loop: lw a0,0x10(sp)  # load"  ->  ("loop", ["lw", "a0", "0x10(sp)"])
+        "end:"                          ->  ("end",  [])
+    """
+
+    if '#' in line:
+        line = line[:line.index('#')]
+
+    label = None
+    if ':' in line:
+        label, _, line = line.partition(':')
+        label = label.strip() or None
+
+    return label, line.replace(',', ' ').split()
+
+
+def lex(line):
+    """
+    Docstring for lex
+
+    - Lexes one source line into its label (or None) and instruction
+
+        "loop: lw a0,0x10(sp)  # load"  ->  ("loop", ("lw", (REGISTER, 10, "a0"), (MEMORY, (16, 2), "0x10(sp)")))
+        "add s1,s2,s3"                  ->  (None,   ("add", (REGISTER, 9, "s1"), ...))
+        "end:"                          ->  ("end",  None)
+        "   # comment" or ""            ->  (None,   None)
+
+    - The instruction is a tuple: the mnemonic followed by one token per operand
+    """
+
+    label, instruct = split(line)
+    if not instruct:
+        return label, None
+    return label, (instruct[0], *map(token, instruct[1:]))
@@ -0,0 +1,207 @@
+import array, encode, sys
+
+# array typecode holding one 32 bit machine word
+WORD = 'I' if array.array('I').itemsize == 4 else 'L'
+
+
+class Half(int):
+    """
+    Docstring for Half
+
+    - A 16 bit compressed (RVC) instruction, see rvc.py; an int that every format writes
+      as 2 bytes / 16 bits instead of 4 / 32
+    """
+
+
+def compressed(words):
+    # whether any word is a 16 bit one, the plain 4 bytes per word paths are used otherwise
+    return any(type(word) is Half for word in words)
+
+
+def format_word(word):
+    """
+    Docstring for format_word
+
+    - Renders a machine word as the 32 character bit-string written to the output file,
+      16 characters for a Half
+    - Lines that failed to encode (None) are written as an empty line
+    """
+
+    if word is None:
+        return ""
+    if type(word) is Half:
+        return format(word, "016b")
+    return encode.to_bits(word)
+
+
+def pack(words):
+    """
+    Docstring for pack
+
+    - Packs machine words into little-endian bytes, 4 per word and 2 per Half
+    - Lines that failed to encode (None) have no machine code and are packed as 0
+    """
+
+    if compressed(words):
+        return b''.join((0 if word is None else word).to_bytes(2 if type(word) is Half else 4, "little")
+                        for word in words)
+    buf = array.array(WORD, [0 if word is None else word for word in words])
+    if sys.byteorder == "big":
+        buf.byteswap()
+    return buf.tobytes()
+
+
+def render_text(words):
+    """
+    Docstring for render_text
+
+    - One 32 character bit-string per line (the default format), 16 for a Half
+    """
+
+    return ''.join(format_word(word) + '\n' for word in words).encode()
+
+
+def render_bin(words):
+    """
+    Docstring for render_bin
+
+    - Raw little-endian machine code, exactly 4 bytes per instruction (2 for a Half)
+    """
+
+    return pack(words)
+
+
+def render_hex(words):
+    """
+    Docstring for render_hex
+
+    - One 8 digit hex word per line, loadable with $readmemh
+    - With Half words, the lines are the 32 bit words of the packed bytes (as memory holds
+      them), the last one padded with zeros
+    """
+
+    if compressed(words):
+        data = pack(words)
+        data += bytes(-len(data) % 4)
+        return ''.join("%08x\n" % int.from_bytes(data[offset:offset + 4], "little")
+                       for offset in range(0, len(data), 4)).encode()
+    return ''.join("%08x\n" % (0 if word is None else word) for word in words).encode()
+
+
+def ihex_record(address, rtype, data):
+    """
+    Docstring for ihex_record
+
+    -> RECORD
+
+        :LLAAAATT<data>CC
+
+        - LL = byte count, AAAA = address, TT = record type
+        - CC = two's complement of the sum of all the bytes before it
+    """
+
+    record = bytes([len(data), address >> 8 & 0xff, address & 0xff, rtype]) + data
+    checksum = -sum(record) & 0xff
+    return ":" + record.hex().upper() + "%02X" % checksum + "\n"
+
+
+def render_ihex(words, address=0, eof=True, record_size=16):
+    """
+    Docstring for render_ihex
+
+    - Intel HEX with record_size data bytes per record, starting at address
+    - An extended linear address record (type 04) is emitted whenever the upper
+      16 bits of the address change
+    - eof=False leaves out the end of file record, for writing a file in pieces
+    """
+
+    data = pack(words)
+    records = []
+    upper = (address - 1) >> 16 if address else 0
+
+    for offset in range(0, len(data), record_size):
+        addr = address + offset
+        if addr >> 16 != upper:
+            upper = addr >> 16
+            records.append(ihex_record(0, 0x04, upper.to_bytes(2, "big")))
+        records.append(ihex_record(addr & 0xffff, 0x00, data[offset:offset + record_size]))
+
+    if eof:
+        records.append(ihex_record(0, 0x01, b""))
+    return ''.join(records).encode()
+
+
+FORMATS = {"text": render_text, "bin": render_bin, "hex": render_hex, "ihex": render_ihex}
+
+
+def open_output(output_file):
+    """
+    Docstring for open_output
+
+    - Opens output_file for binary writing, '-' is stdout
+    """
+
+    if output_file == "-":
+        return open(sys.__stdout__.fileno(), "wb", closefd=False)
+    return open(output_file, "wb")
+
+
+def write(output_file, words, fmt="text"):
+    """
+    Docstring for write
+
+    - Renders every word in the requested format and writes it with a single call
+    - Returns the number of bytes written
+    """
+
+    with open_output(output_file) as fw:
+        return fw.write(FORMATS[fmt](words))
+
+
+class StreamWriter:
+    """
+    Docstring for StreamWriter
+
+    -> USAGE
+
+        with StreamWriter(fw, "bin") as writer:
+            for word in words:
+                writer.write(word)
+
+        - at most buffer_words words are held before they are rendered and written out
+        - the buffer is kept a multiple of 4 words so Intel HEX records stay 16 byte aligned
+    """
+
+    def __init__(self, fw, fmt="text", buffer_words=4096):
+        self.fw = fw
+        self.fmt = fmt
+        self.render = FORMATS[fmt]
+        self.buffer_words = max(4, buffer_words - buffer_words % 4)
+        self.buffer = []
+        self.address = 0
+
+    def write(self, word):
+        self.buffer.append(word)
+        if len(self.buffer) >= self.buffer_words:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.fmt == "ihex":
+            self.fw.write(render_ihex(self.buffer, self.address, eof=False))
+        else:
+            self.fw.write(self.render(self.buffer))
+        self.address += 4 * len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        if self.fmt == "ihex":
+            self.fw.write(render_ihex([], eof=True))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
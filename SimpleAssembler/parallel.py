@@ -0,0 +1,195 @@
+import contextlib, io, multiprocessing, os, time
+import Assembler, cache, ir
+
+# the IR columns encoding reads, sliced into the chunks
+COLUMNS = ("op", "rd", "rs1", "rs2", "imm", "target", "error")
+
+
+def read_manifest(manifest_file):
+    """
+    Docstring for read_manifest
+
+    -> MANIFEST FORMAT
+
+        # comment
+        <input_file> <output_file>
+        <input_file> <output_file>
+
+        - blank lines and lines starting with '#' are ignored
+    """
+
+    jobs = []
+    with open(manifest_file, "r") as fr:
+        for line in fr:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            files = line.split()
+            if len(files) != 2:
+                raise ValueError(f"Invalid manifest line: {line}")
+            jobs.append((files[0], files[1]))
+    return jobs
+
+
+def assemble_file(job):
+    """
+    Docstring for assemble_file
+
+    - Worker for one (input_file, output_file, fmt, cache settings, relax) job
+    - Diagnostics printed by the encoder are captured so each file gets its own report
+    - Returns (input_file, output_file, ok, line count, cache hit, diagnostics)
+    """
+
+    input_file, output_file, fmt, cache_settings, relax = job
+    diagnostics = io.StringIO()
+    output_cache = None if cache_settings is None else cache.OutputCache(*cache_settings)
+    words = []
+
+    try:
+        with contextlib.redirect_stdout(diagnostics):
+            words = Assembler.assemble_file(input_file, output_file, fmt, output_cache, relax=relax)
+    except Exception as error:
+        diagnostics.write(f"{type(error).__name__}: {error}\n")
+        return input_file, output_file, False, len(words), False, diagnostics.getvalue()
+
+    if words is None:
+        return input_file, output_file, True, 0, True, diagnostics.getvalue()
+    return input_file, output_file, None not in words, len(words), False, diagnostics.getvalue()
+
+
+def run_batch(jobs, processes=None, fmt="text", output_cache=None, chunksize=4, relax=True):
+    """
+    Docstring for run_batch
+
+    - Assembles every (input_file, output_file) pair across a pool of processes
+    - Prints one [OK] / [FAILED] line per file in job order and a throughput summary
+    - Cache hits and misses of the workers are added to output_cache's counters
+    - Returns the number of files that failed
+    """
+
+    start = time.perf_counter()
+    failed = 0
+    total_lines = 0
+
+    cache_settings = None
+    if output_cache is not None:
+        cache_settings = (output_cache.directory, output_cache.max_bytes)
+
+    tasks = [(input_file, output_file, fmt, cache_settings, relax) for input_file, output_file in jobs]
+    with multiprocessing.Pool(processes) as pool:
+        for input_file, output_file, ok, lines, hit, diagnostics in pool.imap(assemble_file, tasks, chunksize):
+            total_lines += lines
+            if output_cache is not None:
+                if hit:
+                    output_cache.hits += 1
+                else:
+                    output_cache.misses += 1
+            if ok:
+                print(f"[OK] {input_file} -> {output_file}" + (" (cached)" if hit else ""))
+            else:
+                failed += 1
+                print(f"[FAILED] {input_file}")
+                for message in diagnostics.splitlines():
+                    print(f"    {message}")
+
+    elapsed = time.perf_counter() - start
+    rate = total_lines / elapsed if elapsed else 0.0
+    print(f"{len(jobs) - failed}/{len(jobs)} files assembled, {total_lines} lines in {elapsed:.3f}s "
+          f"({rate:.0f} lines/s, {processes or os.cpu_count()} jobs)")
+
+    return failed
+
+
+# ---------------------------------------------------------------------------------------------- #
+# CHUNKED ENCODING OF A SINGLE FILE                                                              #
+# ---------------------------------------------------------------------------------------------- #
+
+chunk_assembler = None
+chunk_symbols = []
+
+
+def init_chunk_worker(labels, symbols):
+    global chunk_assembler, chunk_symbols
+    chunk_assembler = Assembler.Assembler()
+    chunk_assembler.labels = labels
+    chunk_symbols = symbols
+
+
+def parse_chunk(chunk):
+    """
+    Docstring for parse_chunk
+
+    - Worker for one (first line, source lines) chunk of a file: the ir.Program of just
+      those lines, pcs counted from the chunk's first instruction (see ir.Program.concat)
+    """
+
+    line, source_lines = chunk
+    return ir.Program().extend(source_lines, line)
+
+
+def encode_chunk(chunk):
+    """
+    Docstring for encode_chunk
+
+    - Worker for one (pc, rows) chunk, rows being an ir.Program holding a slice of the
+      columns; the label table and the B/J symbol names are sent once at pool start
+    - Returns the chunk's words and the diagnostics printed while encoding it
+    """
+
+    pc, rows = chunk
+    rows.symbols = chunk_symbols
+    diagnostics = io.StringIO()
+    with contextlib.redirect_stdout(diagnostics):
+        words = list(chunk_assembler.encode_program(rows, pc))
+    return words, diagnostics.getvalue()
+
+
+def assemble_chunked(source_lines, processes=None, chunk_size=None, relax=True):
+    """
+    Docstring for assemble_chunked
+
+    -> THREE STAGES
+
+        - the workers lex chunks of consecutive source lines into IR programs, which are
+          joined in order (ir.Program.concat)
+        - the whole program is relaxed here, once (Assembler.transform), since a relaxed
+          branch moves every label after it
+        - the workers encode chunks of consecutive IR rows: every row only needs the labels
+          and its own pc, so the chunks are independent and joined back in order
+
+    - chunk_size is the number of source lines, then of IR rows, per worker task
+    - Words and diagnostics come out exactly as in Assembler.assemble()
+    """
+
+    source_lines = list(source_lines)
+    processes = processes or os.cpu_count()
+    if not chunk_size:
+        chunk_size = max(1024, -(-len(source_lines) // (processes * 4)))
+
+    assembler = Assembler.Assembler(relax=relax)
+    program = ir.Program()
+    line_chunks = [(start, source_lines[start:start + chunk_size])
+                   for start in range(0, len(source_lines), chunk_size)]
+    with multiprocessing.Pool(processes) as pool:
+        for part in pool.imap(parse_chunk, line_chunks):
+            program.concat(part)
+    program = assembler.transform(program)
+    count = len(program)
+
+    chunks = []
+    for start in range(0, count, chunk_size):
+        rows = ir.Program()
+        for name in COLUMNS:
+            getattr(rows, name).extend(getattr(program, name)[start:start + chunk_size])
+        chunks.append((4 * start, rows))
+
+    words = []
+
+    initargs = (assembler.labels, program.symbols)
+    with multiprocessing.Pool(processes, initializer=init_chunk_worker, initargs=initargs) as pool:
+        for chunk_words, diagnostics in pool.imap(encode_chunk, chunks):
+            words.extend(chunk_words)
+            if diagnostics:
+                print(diagnostics, end="")
+
+    return words
@@ -0,0 +1,243 @@
+import encode, ir
+
+# column positions in a working row
+OP, RD, RS1, RS2, IMM, DEST, SYMBOL, ERROR, LINE = range(9)
+
+ADDI = ir.MNEMONIC_ID["addi"]
+JAL = ir.MNEMONIC_ID["jal"]
+JALR = ir.MNEMONIC_ID["jalr"]
+LW = ir.MNEMONIC_ID["lw"]
+
+# R-type mnemonics where "rd, rd, zero" gives rd back
+IDENTITY_ZERO = {ir.MNEMONIC_ID[_type] for _type in ("add", "sub", "or", "xor", "srl")}
+# ... and "rd, rd, rd"
+IDENTITY_SELF = {ir.MNEMONIC_ID[_type] for _type in ("and", "or")}
+# branches that are never taken when rs1 == rs2
+NEVER_TAKEN = {ir.MNEMONIC_ID[_type] for _type in ("bne", "blt", "bltu")}
+
+
+def load(program):
+    """
+    Docstring for load
+
+    - Unpacks an ir.Program into working rows, with every pc turned into a row index
+
+        [op, rd, rs1, rs2, imm, dest, symbol, error, line]
+
+        - dest      index of the row a B/J instruction goes to, None if its label is not defined
+        - symbol    label name the B/J instruction refers to, None when imm was a number
+
+    - Returns (rows, labels { label : row index }), or None if a numeric B/J offset is not
+      a whole number of instructions or leaves the program (its target cannot be followed)
+    """
+
+    count = len(program)
+    labels = {name: pc // 4 for name, pc in program.labels.items()}
+    rows = []
+    for index, (op, rd, rs1, rs2, imm, target, error) in enumerate(program.rows()):
+        dest = symbol = None
+        if not error and ir.FORMAT[op] in ("B", "J"):
+            if target == ir.NO_TARGET:
+                dest = index + imm // 4
+                if imm % 4 or not 0 <= dest <= count:
+                    return None
+            else:
+                symbol = program.symbols[target]
+                dest = labels.get(symbol)
+        rows.append([op, rd, rs1, rs2, imm, dest, symbol, error, program.line[index]])
+    return rows, labels
+
+
+def store(rows, labels):
+    # back into a Program, pcs and numeric offsets come from the new row indices
+    program = ir.Program()
+    for index, (op, rd, rs1, rs2, imm, dest, symbol, error, line) in enumerate(rows):
+        program.op.append(op)
+        program.rd.append(rd)
+        program.rs1.append(rs1)
+        program.rs2.append(rs2)
+        if symbol is None and dest is not None:
+            imm = 4 * (dest - index)
+        program.imm.append(imm)
+        program.target.append(ir.NO_TARGET if symbol is None else program.symbol(symbol))
+        program.error.append(error)
+        program.line.append(line)
+    program.labels = {name: 4 * index for name, index in labels.items()}
+    return program
+
+
+def reads(row):
+    # registers an instruction reads
+    fmt = ir.FORMAT[row[OP]]
+    if fmt in ("R", "S", "B"):
+        return row[RS1], row[RS2]
+    if fmt == "I":
+        return row[RS1],
+    return ()
+
+
+def writes(row):
+    # register an instruction writes, 0 when none (x0 is never written)
+    return row[RD] if ir.FORMAT[row[OP]] in ("R", "I", "J") else 0
+
+
+def fits(row, dest, index):
+    # whether a B/J instruction at index can reach dest
+    low, high = encode.BOUNDS[ir.WIDTH[ir.FORMAT[row[OP]]]]
+    return dest is not None and low <= 4 * (dest - index) <= high
+
+
+def is_noop(row, index):
+    """
+    Docstring for is_noop
+
+    - True for an instruction that changes nothing but the pc
+
+        R       rd = zero, or add/sub/or/xor/srl rd, rd, zero, or and/or rd, rd, rd
+        addi    rd = zero, or addi rd, rd, 0
+        B       to the next instruction, or bne/blt/bltu with rs1 == rs2
+        jal     zero, to the next instruction
+
+    - A B/J instruction whose label is undefined or out of reach is kept for its diagnostic
+    """
+
+    if row[ERROR]:
+        return False
+    op, rd, rs1, rs2 = row[OP], row[RD], row[RS1], row[RS2]
+    fmt = ir.FORMAT[op]
+    if fmt == "R":
+        return (rd == 0 or (op in IDENTITY_ZERO and rs1 == rd and rs2 == 0)
+                or (op in IDENTITY_SELF and rs1 == rd and rs2 == rd))
+    if op == ADDI:
+        return rd == 0 or (rs1 == rd and row[IMM] == 0)
+    if fmt == "B":
+        return fits(row, row[DEST], index) and (row[DEST] == index + 1 or (op in NEVER_TAKEN and rs1 == rs2))
+    if op == JAL:
+        return rd == 0 and row[DEST] == index + 1
+    return False
+
+
+def thread(rows, row, index):
+    """
+    Docstring for thread
+
+    - Follows a B/J instruction through "jal zero, ..." rows and points it at the end of
+      the chain, as long as the new offset still fits the instruction
+    - Returns True if the row was changed
+    """
+
+    dest, symbol = row[DEST], row[SYMBOL]
+    seen = {index}
+    while dest is not None and dest < len(rows) and dest not in seen:
+        jump = rows[dest]
+        if jump[OP] != JAL or jump[ERROR] or jump[RD] != 0 or not fits(row, jump[DEST], index):
+            break
+        seen.add(dest)
+        dest, symbol = jump[DEST], jump[SYMBOL]
+
+    if dest == row[DEST]:
+        return False
+    row[DEST], row[SYMBOL] = dest, symbol
+    return True
+
+
+def rewrite(rows, leaders):
+    """
+    Docstring for rewrite
+
+    - One sweep over the rows, returning a list of flags for the rows to drop, or None
+      when nothing changed
+    - A pair (row, next) is only merged when next is not a leader, i.e. nothing but row
+      can be executed just before it
+    """
+
+    drop = [False] * len(rows)
+    changed = False
+
+    for index, row in enumerate(rows):
+        if row[ERROR]:
+            continue
+        if is_noop(row, index):
+            drop[index] = changed = True
+            continue
+
+        fmt = ir.FORMAT[row[OP]]
+        if fmt in ("B", "J"):
+            changed |= thread(rows, row, index)
+            continue
+
+        following = index + 1
+        if following == len(rows) or following in leaders or rows[following][ERROR]:
+            continue
+        after = rows[following]
+
+        # addi rd, rs, a ; addi rd, rd, b  ->  addi rd, rs, a + b
+        if row[OP] == ADDI == after[OP] and after[RD] == after[RS1] == row[RD]:
+            low, high = encode.BOUNDS[12]
+            imm = row[IMM] + after[IMM]
+            if low <= imm <= high:
+                after[RS1], after[IMM] = row[RS1], imm
+                drop[index] = changed = True
+                continue
+
+        # rd written and written again before anything reads it (add rd, rs, zero ; lw rd, ...)
+        if fmt in ("R", "I") and row[OP] != JALR and row[OP] != LW:
+            rd = writes(row)
+            if rd and writes(after) == rd and rd not in reads(after):
+                drop[index] = changed = True
+
+    return drop if changed else None
+
+
+def compact(rows, labels, drop):
+    # removes the dropped rows; a label or dest on a dropped row moves to the next row kept
+    new_index = []
+    kept = []
+    for row, dropped in zip(rows, drop):
+        new_index.append(len(kept))
+        if not dropped:
+            kept.append(row)
+    new_index.append(len(kept))
+
+    for row in kept:
+        if row[DEST] is not None:
+            row[DEST] = new_index[row[DEST]]
+    return kept, {name: new_index[index] for name, index in labels.items()}
+
+
+def optimize(program):
+    """
+    Docstring for optimize
+
+    - Peephole pass (-O) over an ir.Program, run before encoding; returns a new Program
+      that does the same thing in fewer instructions
+
+    -> REWRITES (repeated until none applies)
+
+        addi x, x, 0 / add x, x, zero / ...      removed (see is_noop)
+        beq ..., next    jal zero, next          removed
+        addi x, y, 3 ; addi x, x, 5              addi x, y, 8
+        add x, y, zero ; lw x, 0(sp)             lw x, 0(sp)
+        beq ..., L1 ... L1: jal zero, L2         beq ..., L2
+
+    - Label pcs and B/J offsets are recomputed from the rows that are left, a label on a
+      removed instruction names the instruction after it
+    - Rows with an error are kept as they are, so every diagnostic is still printed
+    - Code that computes addresses for jalr itself is not followed; -O is opt-in for that
+      reason. A program with a numeric B/J offset that leaves it is returned unchanged
+    """
+
+    loaded = load(program)
+    if loaded is None:
+        return program
+    rows, labels = loaded
+
+    while True:
+        leaders = set(labels.values())
+        leaders.update(row[DEST] for row in rows if row[DEST] is not None)
+        drop = rewrite(rows, leaders)
+        if drop is None:
+            break
+        rows, labels = compact(rows, labels, drop)
+
+    return store(rows, labels)
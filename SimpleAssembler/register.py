@@ -38,3 +38,6 @@ mapping = {
   "t5":   "11110",
   "t6":   "11111"
 }
+
+# register name -> register number, used by the integer encoder
+numbers = {name: int(bits, 2) for name, bits in mapping.items()}
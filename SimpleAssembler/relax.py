@@ -0,0 +1,173 @@
+import heapq, itertools
+import analysis, encode, ir
+
+JAL = ir.MNEMONIC_ID["jal"]
+
+# conditional branch -> the branch taken in exactly the other cases
+INVERSE = {ir.MNEMONIC_ID[_type]: ir.MNEMONIC_ID[inverse] for _type, inverse in (
+    ("beq", "bne"), ("bne", "beq"), ("blt", "bge"), ("bge", "blt"), ("bltu", "bgeu"), ("bgeu", "bltu"))}
+
+
+class AddressIndex:
+    """
+    Docstring for AddressIndex
+
+    - Fenwick tree over the rows that have grown by one unit (4 bytes here, 2 for RVC)
+
+        address(index)  pc of row index, unit * index + unit * (grown rows before it), O(log n)
+        grow(index)     row index becomes one unit longer, O(log n)
+
+    - grown lists the rows that start out grown, the tree is built from them in O(n)
+    """
+
+    def __init__(self, count, unit=4, grown=()):
+        self.unit = unit
+        self.tree = tree = [0] * (count + 1)
+        for index in grown:
+            tree[index + 1] += 1
+        for index in range(1, count + 1):
+            parent = index + (index & -index)
+            if parent <= count:
+                tree[parent] += tree[index]
+
+    def grow(self, index):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += 1
+            index += index & -index
+
+    def address(self, index):
+        grown = 0
+        position = index
+        while position > 0:
+            grown += self.tree[position]
+            position -= position & -position
+        return self.unit * (index + grown)
+
+
+def slack(index, dest, addresses):
+    # how many bytes the branch at index can still be pushed away from dest, < 0 if it is out of range
+    low, high = encode.BOUNDS[13]
+    offset = addresses.address(dest) - addresses.address(index)
+    return min(offset - low, high - offset)
+
+
+def in_reach(program):
+    """
+    Docstring for in_reach
+
+    - True when every conditional branch reaches its destination in the layout the program
+      already has (4 bytes per row), so relax() has nothing to rewrite
+    - One linear pass over the columns, what relax() pays on the usual program instead of
+      the destinations, the AddressIndex and the heap
+    """
+
+    low, high = encode.BOUNDS[13]
+    count = len(program)
+    addresses = [program.labels.get(name) for name in program.symbols]
+    imm, target, error = program.imm, program.target, program.error
+    # only the conditional branches' rows are visited, compress() skips the others
+    for index in itertools.compress(itertools.count(), map(INVERSE.__contains__, program.op)):
+        if error[index]:
+            continue
+        # the destination as analysis.destinations() finds it, branches it finds none for are never relaxed
+        symbol = target[index]
+        pc = 4 * index + imm[index] if symbol == ir.NO_TARGET else addresses[symbol]
+        if pc is None or pc % 4 or not 0 <= pc <= 4 * count:
+            continue
+        if not low <= pc - 4 * index <= high:
+            return False
+    return True
+
+
+def relax(program):
+    """
+    Docstring for relax
+
+    - Rewrites every conditional branch whose target is out of reach (beyond -4096..4095
+      bytes) into an inverted branch over a jal, returns a new Program
+
+        beq s1, s2, far    ->   bne s1, s2, 8
+                                jal zero, far
+
+    -> FIXED POINT
+
+        - a relaxed branch makes the code between other branches and their targets longer,
+          so those can go out of reach in turn; rows only ever grow, so it ends
+        - addresses come from an AddressIndex, and a branch with s bytes of slack is only
+          checked again once the program has grown by more than s bytes since it was last
+          checked (a heap keyed on that growth), never by rescanning the program
+        - a program whose branches are all in reach already (in_reach) is returned as it is
+
+    - Label pcs and numeric B/J offsets into the program are recomputed for the new layout;
+      a jal still out of reach after relaxing keeps its diagnostic, a recomputed number out
+      of reach gets the one a number out of bounds gets in the source
+    """
+
+    if in_reach(program):
+        return program
+
+    count = len(program)
+    dests = analysis.destinations(program)
+    addresses = AddressIndex(count)
+    relaxed = [False] * count
+    growth = 0
+    pending = []
+
+    def check(index):
+        nonlocal growth
+        room = slack(index, dests[index], addresses)
+        if room < 0:
+            relaxed[index] = True
+            addresses.grow(index)
+            growth += 4
+        else:
+            heapq.heappush(pending, (growth + room, index))
+
+    for index, dest in enumerate(dests):
+        if dest is not None and program.op[index] in INVERSE:
+            check(index)
+    while pending and pending[0][0] < growth:
+        check(heapq.heappop(pending)[1])
+
+    if not any(relaxed):
+        return program
+
+    # new index of every row (and of the end)
+    new_index = []
+    shift = 0
+    for index in range(count):
+        new_index.append(index + shift)
+        shift += relaxed[index]
+    new_index.append(count + shift)
+
+    # the rows between two relaxed branches are copied a slice at a time, symbols keep their ids
+    result = ir.Program()
+    columns = ("op", "rd", "rs1", "rs2", "imm", "target", "error", "line")
+    copied = 0
+    for index in (index for index in range(count) if relaxed[index]):
+        for name in columns:
+            getattr(result, name).extend(getattr(program, name)[copied:index])
+        op, rd, rs1, rs2, imm, target, error, line = (getattr(program, name)[index] for name in columns)
+        result.add(INVERSE[op], rd, rs1, rs2, 8, ir.NO_TARGET, error, line)
+        result.add(JAL, 0, 0, 0, imm, target, error, line)
+        copied = index + 1
+    for name in columns:
+        getattr(result, name).extend(getattr(program, name)[copied:])
+    result.symbols = list(program.symbols)
+    result.symbol_id = dict(program.symbol_id)
+
+    # numeric B/J offsets into the program point at the same instruction as before
+    for index, dest in enumerate(dests):
+        if dest is not None and program.target[index] == ir.NO_TARGET:
+            here = new_index[index] + relaxed[index]
+            offset = 4 * (new_index[dest] - here)
+            low, high = encode.BOUNDS[ir.WIDTH[ir.FORMAT[result.op[here]]]]
+            if low <= offset <= high:
+                result.imm[here] = offset
+            else:
+                result.imm[here] = result.rd[here] = result.rs1[here] = result.rs2[here] = 0
+                result.error[here] = ir.OUT_OF_BOUNDS
+
+    result.labels = {name: 4 * new_index[min(pc // 4, count)] for name, pc in program.labels.items()}
+    return result
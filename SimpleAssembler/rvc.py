@@ -0,0 +1,257 @@
+import heapq
+import analysis, ir, output, relax
+
+ADD = ir.MNEMONIC_ID["add"]
+ADDI = ir.MNEMONIC_ID["addi"]
+LW = ir.MNEMONIC_ID["lw"]
+SW = ir.MNEMONIC_ID["sw"]
+BEQ = ir.MNEMONIC_ID["beq"]
+BNE = ir.MNEMONIC_ID["bne"]
+JAL = ir.MNEMONIC_ID["jal"]
+JALR = ir.MNEMONIC_ID["jalr"]
+
+# CA-format mnemonics (rd', rs2' only) -> funct2, and the R-type mnemonic each one compresses
+FUNCT2 = {"c.sub": 0b00, "c.xor": 0b01, "c.or": 0b10, "c.and": 0b11}
+ARITHMETIC = {ir.MNEMONIC_ID[name[2:]]: name for name in FUNCT2}
+# rd = rs1 op rs2 == rs2 op rs1
+COMMUTATIVE = {ir.MNEMONIC_ID[_type] for _type in ("add", "xor", "or", "and")}
+
+# offset ranges of the compressed branches and jumps
+RANGE = {"c.beqz": (-256, 254), "c.bnez": (-256, 254), "c.j": (-2048, 2046), "c.jal": (-2048, 2046)}
+
+# mnemonics in the order the report lists them
+MNEMONICS = ["c.addi", "c.add", "c.sub", "c.xor", "c.or", "c.and", "c.lw", "c.sw",
+             "c.beqz", "c.bnez", "c.j", "c.jal", "c.jr", "c.jalr"]
+
+
+def compact(reg):
+    # x8..x15 (s0, s1, a0..a5) are the only registers the CA/CL/CS/CB formats can name
+    return 8 <= reg <= 15
+
+
+def candidate(op, rd, rs1, rs2, imm):
+    """
+    Docstring for candidate
+
+    - The compressed form of one IR row as (mnemonic, a, b), None when the operands do not
+      allow one; c.beqz/c.bnez/c.j/c.jal still depend on their offset (see RANGE)
+
+        addi rd, rd, imm            c.addi  rd, imm         rd != 0, imm != 0, -32..31
+        add rd, rd, rs2             c.add   rd, rs2         rd, rs2 != 0
+        sub/xor/or/and rd, rd, rs2  c.sub   rd', rs2'       ...
+        lw rd, imm(rs1)             c.lw    rd', imm(rs1')  imm a multiple of 4, 0..124
+        sw rs2, imm(rs1)            c.sw    rs2', imm(rs1') ...
+        beq/bne rs1, zero, L        c.beqz  rs1', L
+        jal zero / ra, L            c.j L / c.jal L
+        jalr zero / ra, rs1, 0      c.jr rs1 / c.jalr rs1   rs1 != 0
+
+        - rd' / rs1' / rs2' are x8..x15, add/xor/or/and also match with rs1 and rs2 swapped
+          and beq/bne with rs1 = zero
+    """
+
+    fmt = ir.FORMAT[op]
+    if fmt == "R":
+        if op in COMMUTATIVE and rs2 == rd != rs1:
+            rs1, rs2 = rs2, rs1
+        if rs1 != rd:
+            return None
+        if op == ADD:
+            return ("c.add", rd, rs2) if rd and rs2 else None
+        if op in ARITHMETIC and compact(rd) and compact(rs2):
+            return ARITHMETIC[op], rd, rs2
+        return None
+
+    if op == ADDI:
+        return ("c.addi", rd, imm) if rd and rs1 == rd and imm and -32 <= imm <= 31 else None
+
+    if op in (LW, SW):
+        reg = rd if op == LW else rs2
+        if compact(reg) and compact(rs1) and imm % 4 == 0 and 0 <= imm <= 124:
+            return "c.lw" if op == LW else "c.sw", reg, rs1
+        return None
+
+    if op in (BEQ, BNE):
+        reg = rs1 if rs2 == 0 else rs2 if rs1 == 0 else None
+        if reg is not None and compact(reg):
+            return "c.beqz" if op == BEQ else "c.bnez", reg, 0
+        return None
+
+    if op in (JAL, JALR) and rd in (0, 1):
+        if op == JAL:
+            return "c.jal" if rd else "c.j", 0, 0
+        if rs1 and imm == 0:
+            return "c.jalr" if rd else "c.jr", rs1, 0
+    return None
+
+
+def encode(kind, offset=0):
+    """
+    Docstring for encode
+
+    - Packs a candidate() tuple into its 16 bit instruction word; offset is the branch or
+      jump offset of c.beqz/c.bnez/c.j/c.jal (already in RANGE), the immediate of c.lw/c.sw
+
+    -> ENCODING (bit 15 first, rd' / rs1' / rs2' are 3 bit fields holding the register - 8)
+
+        CI  c.addi              000 | imm[5] | rd | imm[4:0] | 01
+        CR  c.add               1001 | rd | rs2 | 10
+            c.jr / c.jalr       1000 / 1001 | rs1 | 00000 | 10
+        CA  c.sub/xor/or/and    100011 | rd' | funct2 (00/01/10/11) | rs2' | 01
+        CL  c.lw                010 | uimm[5:3] | rs1' | uimm[2|6] | rd' | 00
+        CS  c.sw                110 | uimm[5:3] | rs1' | uimm[2|6] | rs2' | 00
+        CB  c.beqz / c.bnez     110 / 111 | off[8|4:3] | rs1' | off[7:6|2:1|5] | 01
+        CJ  c.j / c.jal         101 / 001 | off[11|4|9:8|10|6|7|3:1|5] | 01
+    """
+
+    name, a, b = kind
+    if name == "c.addi":
+        return (b >> 5 & 0x1) << 12 | a << 7 | (b & 0x1f) << 2 | 0b01
+    if name == "c.add":
+        return 0b1001 << 12 | a << 7 | b << 2 | 0b10
+    if name in ("c.jr", "c.jalr"):
+        return (0b1001 if name == "c.jalr" else 0b1000) << 12 | a << 7 | 0b10
+    if name in ("c.lw", "c.sw"):
+        return ((0b010 if name == "c.lw" else 0b110) << 13 | (offset >> 3 & 0x7) << 10 | (b - 8) << 7
+                | (offset >> 2 & 0x1) << 6 | (offset >> 6 & 0x1) << 5 | (a - 8) << 2)
+    if name in ("c.beqz", "c.bnez"):
+        return ((0b110 if name == "c.beqz" else 0b111) << 13 | (offset >> 8 & 0x1) << 12
+                | (offset >> 3 & 0x3) << 10 | (a - 8) << 7 | (offset >> 6 & 0x3) << 5
+                | (offset >> 1 & 0x3) << 3 | (offset >> 5 & 0x1) << 2 | 0b01)
+    if name in ("c.j", "c.jal"):
+        return ((0b101 if name == "c.j" else 0b001) << 13 | (offset >> 11 & 0x1) << 12
+                | (offset >> 4 & 0x1) << 11 | (offset >> 8 & 0x3) << 9 | (offset >> 10 & 0x1) << 8
+                | (offset >> 6 & 0x1) << 7 | (offset >> 7 & 0x1) << 6 | (offset >> 1 & 0x7) << 3
+                | (offset >> 5 & 0x1) << 2 | 0b01)
+    # c.sub / c.xor / c.or / c.and
+    return 0b100011 << 10 | (a - 8) << 7 | FUNCT2[name] << 5 | (b - 8) << 2 | 0b01
+
+
+class Layout:
+    """
+    Docstring for Layout
+
+    -> COLLECTED (layout() fills it in)
+
+        - kind          per row, its candidate() tuple if it is emitted in 16 bits, else None
+        - address       pc of every row, plus the end of the program (its size in bytes)
+        - dests         analysis.destinations() of the program
+        - labels        { label : pc } with the compressed pcs
+        - out_of_reach  compressible branches/jumps kept at 32 bits for their offset
+    """
+
+    def __init__(self, program):
+        self.program = program
+        self.kind = []
+        self.address = []
+        self.dests = []
+        self.labels = {}
+        self.out_of_reach = 0
+
+    def report(self):
+        count = len(self.program)
+        before = 4 * count
+        after = self.address[-1]
+        counts = dict.fromkeys(MNEMONICS, 0)
+        for kind in self.kind:
+            if kind is not None:
+                counts[kind[0]] += 1
+        compressed = sum(counts.values())
+
+        lines = [f"rvc: {compressed} of {count} instructions compressed, {before} -> {after} bytes"
+                 + (f" ({100 * (before - after) / before:.1f}% smaller)" if before else "")]
+        for name, total in counts.items():
+            if total:
+                lines.append(f"  {name:<8} {total:10d}")
+        if self.out_of_reach:
+            lines.append(f"  {'kept':<8} {self.out_of_reach:10d}  c.beqz/c.bnez/c.j/c.jal out of reach, left at 32 bits")
+        return '\n'.join(lines)
+
+
+def layout(program):
+    """
+    Docstring for layout
+
+    - Label pass of --rvc: picks the rows emitted in 16 bits and gives every row and label
+      its pc, rows now being 2 or 4 bytes long
+
+    -> FIXED POINT
+
+        - every candidate starts out compressed; a c.beqz/c.bnez/c.j/c.jal whose offset is
+          out of RANGE grows back to 32 bits, which moves the code after it, so others can
+          go out of range in turn; rows only ever grow, so it ends
+        - same bookkeeping as relax.relax: a relax.AddressIndex counting 2 byte units, and a
+          heap so a branch is only checked again once the code has grown past its slack
+
+    - The code only shrinks against 4 bytes per row, so B/J rows that fit before still fit
+    """
+
+    result = Layout(program)
+    count = len(program)
+    dests = result.dests = analysis.destinations(program)
+    kind = result.kind
+
+    for index, row in enumerate(program.rows()):
+        op, rd, rs1, rs2, imm, target, error = row
+        kind.append(None if error else candidate(op, rd, rs1, rs2, imm))
+        # a branch or jump is only compressed when its destination can be followed
+        if kind[index] is not None and kind[index][0] in RANGE and dests[index] is None:
+            kind[index] = None
+
+    addresses = relax.AddressIndex(count, 2, [index for index in range(count) if kind[index] is None])
+    growth = 0
+    pending = []
+
+    def check(index):
+        nonlocal growth
+        low, high = RANGE[kind[index][0]]
+        offset = addresses.address(dests[index]) - addresses.address(index)
+        room = min(offset - low, high - offset)
+        if room < 0:
+            kind[index] = None
+            result.out_of_reach += 1
+            addresses.grow(index)
+            growth += 2
+        else:
+            heapq.heappush(pending, (growth + room, index))
+
+    for index in range(count):
+        if kind[index] is not None and kind[index][0] in RANGE:
+            check(index)
+    while pending and pending[0][0] < growth:
+        check(heapq.heappop(pending)[1])
+
+    pc = 0
+    for index in range(count):
+        result.address.append(pc)
+        pc += 4 if kind[index] is None else 2
+    result.address.append(pc)
+    result.labels = {name: result.address[min(pc // 4, count)] for name, pc in program.labels.items()}
+    return result
+
+
+def emit(program, layout):
+    """
+    Docstring for emit
+
+    - Generator stage: the rows of an ir.Program in, machine words out, an output.Half for
+      every row layout() compressed
+    - B/J offsets, from labels or numbers, are recomputed for the compressed pcs; a number
+      that leaves the program is kept as it is, an undefined label still gets its diagnostic
+    """
+
+    address = layout.address
+    encode_row = ir.encode_row
+    NO_TARGET = ir.NO_TARGET
+    Half = output.Half
+
+    for index, (row, kind, dest) in enumerate(zip(program.rows(), layout.kind, layout.dests)):
+        op, rd, rs1, rs2, imm, target, error = row
+        pc = address[index]
+        if kind is not None:
+            yield Half(encode(kind, address[dest] - pc if kind[0] in RANGE else imm))
+            continue
+        if dest is not None:
+            target = address[dest]
+        elif target != NO_TARGET:
+            target = None
+        yield encode_row(op, rd, rs1, rs2, imm, target, error, pc)
@@ -0,0 +1,196 @@
+import array
+import analysis, ir
+
+LW = ir.MNEMONIC_ID["lw"]
+SW = ir.MNEMONIC_ID["sw"]
+JALR = ir.MNEMONIC_ID["jalr"]
+
+# cycles from an instruction to one that uses its result (lw needs the load-use stall)
+LATENCY = [1 + analysis.LOAD_USE_STALL if op == LW else 1 for op in range(len(ir.MNEMONICS))]
+
+# longest stretch of a block scheduled at once, keeps the pass linear on huge blocks
+WINDOW = 64
+
+
+def registers(program, index):
+    # (registers read, register written or 0) by one instruction, x0 left out
+    op = program.op[index]
+    read = []
+    if analysis.READS_RS1[op] and program.rs1[index]:
+        read.append(program.rs1[index])
+    if analysis.READS_RS2[op] and program.rs2[index]:
+        read.append(program.rs2[index])
+    return read, program.rd[index] if analysis.WRITES_RD[op] else 0
+
+
+def load_use(program, first, second):
+    # whether row second uses the result of row first, a lw, right after it
+    if first is None or second is None or program.op[first] != LW or not program.rd[first]:
+        return False
+    return program.rd[first] in registers(program, second)[0]
+
+
+def stalls(program, order):
+    # load-use stalls of running the rows in order, back to back
+    return sum(load_use(program, first, second) for first, second in zip(order, order[1:]))
+
+
+def dependencies(program, body):
+    """
+    Docstring for dependencies
+
+    - Edges of the dependency graph of a block body, as a list of predecessors per position
+
+        RAW / WAR / WAW     through the last writer and the readers since, per register
+        memory              lw after the last sw, sw after the last sw and every lw since
+                            (addresses are not compared, any two of them may alias)
+    """
+
+    preds = [set() for _ in body]
+    writer = {}
+    readers = {}
+    store = None
+    loads = []
+
+    for position, index in enumerate(body):
+        read, written = registers(program, index)
+        for reg in read:
+            if reg in writer:
+                preds[position].add(writer[reg])
+        if written:
+            if written in writer:
+                preds[position].add(writer[written])
+            preds[position].update(readers.get(written, ()))
+
+        op = program.op[index]
+        if op == LW:
+            if store is not None:
+                preds[position].add(store)
+            loads.append(position)
+        elif op == SW:
+            if store is not None:
+                preds[position].add(store)
+            preds[position].update(loads)
+            store = position
+            loads = []
+
+        for reg in read:
+            readers.setdefault(reg, []).append(position)
+        if written:
+            writer[written] = position
+            readers[written] = []
+
+        preds[position].discard(position)
+    return preds
+
+
+def list_schedule(program, body, before, after):
+    """
+    Docstring for list_schedule
+
+    - Orders a stretch of a block (row indices, no B/J/jalr) so a lw is not directly
+      followed by a use of its result, keeping every dependency
+    - before / after are the rows that run right before and after the stretch, or None
+    - At each step the ready instruction picked is, in order of preference: one that does
+      not stall on the row before it, one that does not leave a stall for after, the one
+      with the longest latency path to the end of the stretch, the one first in the source
+    """
+
+    count = len(body)
+    preds = dependencies(program, body)
+    succs = [[] for _ in body]
+    for position, earlier in enumerate(preds):
+        for pred in earlier:
+            succs[pred].append(position)
+
+    # longest latency path from each instruction to the end of the stretch
+    height = [0] * count
+    for position in range(count - 1, -1, -1):
+        latency = LATENCY[program.op[body[position]]]
+        height[position] = latency + max((height[succ] for succ in succs[position]), default=0)
+
+    waiting = [len(earlier) for earlier in preds]
+    ready = [position for position in range(count) if not waiting[position]]
+    order = []
+    previous = before
+
+    while ready:
+        final = len(order) + 1 == count
+        pick = min(ready, key=lambda position: (load_use(program, previous, body[position]),
+                                                final and load_use(program, body[position], after),
+                                                -height[position], position))
+        ready.remove(pick)
+        order.append(body[pick])
+        previous = body[pick]
+        for succ in succs[pick]:
+            waiting[succ] -= 1
+            if not waiting[succ]:
+                ready.append(succ)
+
+    return order
+
+
+def schedule(program):
+    """
+    Docstring for schedule
+
+    - Scheduling pass (--schedule) over an ir.Program, run before encoding: reorders the
+      instructions inside each basic block so fewer lw results are used by the very next
+      instruction; returns a new Program
+
+    -> RULES
+
+        - blocks end at labels, B/J destinations and after B/J/jalr (analysis.leaders);
+          the B/J/jalr ending a block stays last
+        - register dependencies (RAW, WAR, WAW) and the order between a sw and any other
+          lw/sw are kept
+        - a block is only changed when it ends up with fewer load-use stalls, and blocks
+          holding an instruction with an error are left as they are
+        - long blocks are scheduled WINDOW instructions at a time
+
+    - Every block keeps its place and its branch stays at the block's end, so label pcs and
+      B/J offsets resolve the same way when the new program is encoded
+    """
+
+    count = len(program)
+    leader = analysis.leaders(program, analysis.destinations(program))
+    order = []
+
+    start = 0
+    for index in range(1, count + 1):
+        if not leader[index]:
+            continue
+        block = list(range(start, index))
+        start = index
+
+        last = block[-1]
+        branch = analysis.BRANCH[program.op[last]] or program.op[last] == JALR
+        body = block[:-1] if branch else block
+        after = last if branch else None
+
+        if len(body) < 2 or any(program.error[row] for row in block):
+            order.extend(block)
+            continue
+
+        scheduled = []
+        for first in range(0, len(body), WINDOW):
+            window = body[first:first + WINDOW]
+            following = body[first + WINDOW] if first + WINDOW < len(body) else after
+            scheduled += list_schedule(program, window, scheduled[-1] if scheduled else None, following)
+        tail = [after] if branch else []
+        if stalls(program, scheduled + tail) < stalls(program, body + tail):
+            order.extend(scheduled + tail)
+        else:
+            order.extend(block)
+
+    if order == list(range(count)):
+        return program
+
+    result = ir.Program()
+    for name in ("op", "rd", "rs1", "rs2", "imm", "target", "error", "line"):
+        column = getattr(program, name)
+        setattr(result, name, array.array(column.typecode, [column[index] for index in order]))
+    result.labels = dict(program.labels)
+    result.symbols = list(program.symbols)
+    result.symbol_id = dict(program.symbol_id)
+    return result
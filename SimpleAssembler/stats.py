@@ -0,0 +1,69 @@
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Stats:
+    """
+    Docstring for Stats
+
+    -> COLLECTED (only when an Assembler is given a Stats object)
+
+        - phases        { "read" | "lex" | "optimize" | "schedule" | "relax" | "layout" | "encode"
+                          | "write" : seconds }, the passes that ran, in order
+        - formats       { "R" | "I" | "S" | "B" | "J" : instruction count }
+        - mnemonics     { mnemonic : [count, seconds spent encoding] }
+        - bytes_read, bytes_written
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.formats = {}
+        self.mnemonics = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add_phase(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_instruction(self, _type, _format, seconds):
+        self.formats[_format] = self.formats.get(_format, 0) + 1
+        entry = self.mnemonics.setdefault(_type, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def peak_memory(self):
+        """
+        Docstring for peak_memory
+
+        - Peak resident set size of this process in bytes, None where it is not available
+        """
+
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def report(self):
+        lines = ["phases:"]
+        for phase, seconds in self.phases.items():
+            lines.append(f"  {phase:<8} {seconds * 1000:10.3f} ms")
+
+        lines.append("formats:")
+        for _format, count in sorted(self.formats.items()):
+            lines.append(f"  {_format:<8} {count:10d}")
+
+        lines.append("encode time per mnemonic:")
+        for _type, (count, seconds) in sorted(self.mnemonics.items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {_type:<8} {count:10d} x {seconds * 1e6 / count:8.2f} us = {seconds * 1000:10.3f} ms")
+
+        lines.append(f"bytes read:    {self.bytes_read}")
+        lines.append(f"bytes written: {self.bytes_written}")
+        peak = self.peak_memory()
+        if peak is not None:
+            lines.append(f"peak memory:   {peak / (1024 * 1024):.1f} MiB")
+        return '\n'.join(lines)
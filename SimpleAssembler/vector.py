@@ -0,0 +1,131 @@
+import time
+import Assembler, encode, ir
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def encode_columns(op, rd, rs1, rs2, imm):
+    """
+    Docstring for encode_columns
+
+    - Packs whole columns at once, same bit layout as encode.r_type ... encode.j_type
+
+        R   base | rs2 << 20 | rs1 << 15 | rd << 7
+        I   base | imm[11:0] << 20 | rs1 << 15 | rd << 7
+        S   base | imm[11:5] << 25 | rs2 << 20 | rs1 << 15 | imm[4:0] << 7
+        B   base | imm[12|10:5] << 25 | rs2 << 20 | rs1 << 15 | imm[4:1|11] << 7
+        J   base | imm[20|10:1|11|19:12] << 12 | rd << 7
+
+    - Returns a uint32 array, one word per row
+    """
+
+    u32 = numpy.uint32
+    base = numpy.array([encode.BASE[_type] for _type in ir.MNEMONICS], dtype=u32)[op]
+    fmt = numpy.array(ir.FORMAT)[op]
+    rd = rd.astype(u32)
+    rs1 = rs1.astype(u32)
+    rs2 = rs2.astype(u32)
+    imm = imm.astype(numpy.int64).astype(u32)
+
+    words = base | rs1 << u32(15)
+
+    mask = fmt == "R"
+    words[mask] |= rs2[mask] << u32(20) | rd[mask] << u32(7)
+
+    mask = fmt == "I"
+    words[mask] |= (imm[mask] & u32(0xfff)) << u32(20) | rd[mask] << u32(7)
+
+    mask = fmt == "S"
+    words[mask] |= ((imm[mask] >> u32(5) & u32(0x7f)) << u32(25) | rs2[mask] << u32(20)
+                    | (imm[mask] & u32(0x1f)) << u32(7))
+
+    mask = fmt == "B"
+    b = imm[mask]
+    words[mask] |= ((b >> u32(12) & u32(0x1)) << u32(31) | (b >> u32(5) & u32(0x3f)) << u32(25)
+                    | rs2[mask] << u32(20)
+                    | (b >> u32(1) & u32(0xf)) << u32(8) | (b >> u32(11) & u32(0x1)) << u32(7))
+
+    mask = fmt == "J"
+    j = imm[mask]
+    words[mask] |= ((j >> u32(20) & u32(0x1)) << u32(31) | (j >> u32(1) & u32(0x3ff)) << u32(21)
+                   | (j >> u32(11) & u32(0x1)) << u32(20) | (j >> u32(12) & u32(0xff)) << u32(12)
+                   | rd[mask] << u32(7))
+
+    return words
+
+
+def offsets(program, labels):
+    """
+    Docstring for offsets
+
+    - The imm column with B/J label references resolved to pc-relative offsets
+    - Also returns a mask of the rows the columns can pack: no error in the IR, a defined
+      label and an offset within the B/J bounds; the rest is left to ir.encode_row
+    """
+
+    op = numpy.frombuffer(program.op, dtype=numpy.uint8)
+    imm = numpy.frombuffer(program.imm, dtype=numpy.int32).astype(numpy.int64)
+    target = numpy.frombuffer(program.target, dtype=numpy.int32)
+    ok = numpy.frombuffer(program.error, dtype=numpy.uint8) == 0
+
+    refs = numpy.flatnonzero(target != ir.NO_TARGET)
+    if len(refs):
+        addresses = [labels.get(name) for name in program.symbols]
+        defined = numpy.array([address is not None for address in addresses])
+        address = numpy.array([address or 0 for address in addresses], dtype=numpy.int64)
+
+        width = numpy.array([ir.WIDTH.get(fmt, 0) for fmt in ir.FORMAT])[op[refs]]
+        low = numpy.where(width == 13, encode.BOUNDS[13][0], encode.BOUNDS[21][0])
+        high = numpy.where(width == 13, encode.BOUNDS[13][1], encode.BOUNDS[21][1])
+
+        offset = address[target[refs]] - 4 * refs
+        imm[refs] = offset
+        ok[refs] &= defined[target[refs]] & (offset >= low) & (offset <= high)
+
+    return imm, ok
+
+
+def assemble(source_lines, optimize=False, schedule=False, relax=True, stats=None):
+    """
+    Docstring for assemble
+
+    - Same result as Assembler.assemble(), bit for bit, but packs the ir.Program columns
+      with NumPy instead of row by row
+    - Rows that would print a diagnostic are encoded one by one by ir.encode_row (printing
+      it, giving None), in source order, everything else is packed column-wise
+    - The program goes through Assembler.parse(), so -O, --schedule and branch relaxation
+      apply the same way
+    - With stats, records the phases of Assembler.parse() and the encode phase (no
+      per-mnemonic times, the columns are packed all at once)
+    - Falls back to Assembler.assemble() when NumPy is not installed
+    """
+
+    asm = Assembler.Assembler(stats, optimize=optimize, schedule=schedule, relax=relax)
+    if numpy is None:
+        return asm.assemble(source_lines)
+
+    clock = time.perf_counter
+    program = asm.parse(source_lines)
+    if not len(program):
+        return []
+
+    start = clock()
+
+    imm, ok = offsets(program, program.labels)
+    op, rd, rs1, rs2 = (numpy.frombuffer(column, dtype=numpy.uint8)
+                        for column in (program.op, program.rd, program.rs1, program.rs2))
+    words = encode_columns(op, rd, rs1, rs2, imm).tolist()
+
+    addresses = [program.labels.get(name) for name in program.symbols]
+    for index in numpy.flatnonzero(~ok).tolist():
+        target = program.target[index]
+        address = ir.NO_TARGET if target == ir.NO_TARGET else addresses[target]
+        words[index] = ir.encode_row(program.op[index], program.rd[index], program.rs1[index], program.rs2[index],
+                                     program.imm[index], address, program.error[index], 4 * index)
+
+    if stats is not None:
+        stats.add_phase("encode", clock() - start)
+    return words
@@ -3,7 +3,55 @@
 from colors import bcolors
 
 from Grader import Grader
-import os
+import collections, contextlib, io, multiprocessing, os, sys, time
+
+# Assembler module, imported once per worker process by initWorker
+Assembler = None
+
+def initWorker(asmDir):
+	global Assembler
+	sys.path.insert(0, asmDir)
+	import Assembler
+
+def assembleTest(inputFile, outputFile, options=None):
+	# runs in a worker: assemble in-process, capturing diagnostics instead of spawning python3
+	# options are assemble_file keyword arguments, {"stream": True} for Assembler.stream,
+	# {"one_pass": True} for the command line's --one-pass, or {"jobs": N, "chunk_size": K}
+	# for its --jobs on one file, or {"watch": True} for the IncrementalAssembler behind --watch,
+	# updating a first version with the middle third of the lines left out to the whole file
+	# returns (diagnostics, seconds spent in the assembler, whether the assembler raised)
+	options = dict(options or {})
+	diagnostics = io.StringIO()
+	raised = False
+	start = time.perf_counter()
+	try:
+		with contextlib.redirect_stdout(diagnostics):
+			if outputFile is None:
+				with open(inputFile, 'r') as fr:
+					Assembler.assemble(fr)
+			elif options.pop("stream", False):
+				Assembler.stream(inputFile, outputFile)
+			elif options.pop("one_pass", False):
+				Assembler.main(["--one-pass", inputFile, outputFile])
+			elif options.pop("watch", False):
+				import incremental, output
+				with open(inputFile, 'r') as fr:
+					lines = fr.readlines()
+				third = len(lines) // 3
+				inc = incremental.IncrementalAssembler()
+				# only the diagnostics of the update are the test's
+				with contextlib.redirect_stdout(io.StringIO()):
+					inc.assemble(lines[:third] + lines[2 * third:])
+				output.write(outputFile, inc.update(lines), "text")
+			elif "jobs" in options:
+				Assembler.main(["--jobs", str(options["jobs"]), "--chunk-size", str(options["chunk_size"]),
+								inputFile, outputFile])
+			else:
+				Assembler.assemble_file(inputFile, outputFile, **options)
+	except (Exception, SystemExit) as error:
+		diagnostics.write(type(error).__name__ + ": " + str(error) + "\n")
+		raised = True
+	return diagnostics.getvalue(), time.perf_counter() - start, raised
 
 class AsmGrader(Grader):
 
@@ -19,100 +67,174 @@ class AsmGrader(Grader):
 	BIN_HARD_DIR = "bin_h"
 	BIN_SIMPLE_DIR = "bin_s"
 
-	def __init__(self, verb, enable,operating_system):
-		super().__init__(verb, enable,operating_system)
+	# feature tests, one suite per assembler feature, reported but not graded:
+	# (suite name, input dir, expected output dir, generated output dir, assembler options)
+	FEATURE_SUITES = [
+		("lexBin", "lexBin", "bin_l", "user_bin_l", {}),
+		("lexBin --stream", "lexBin", "bin_l", "user_bin_l_stream", {"stream": True}),
+		("lexBin --one-pass", "lexBin", "bin_l", "user_bin_l_one_pass", {"one_pass": True}),
+		("lexBin --watch", "lexBin", "bin_l", "user_bin_l_watch", {"watch": True}),
+		("optBin -O", "optBin", "bin_o", "user_bin_o", {"optimize": True}),
+		("scheduleBin --schedule", "scheduleBin", "bin_sc", "user_bin_sc", {"schedule": True}),
+		("relaxBin", "relaxBin", "bin_r", "user_bin_r", {}),
+		("relaxBin --jobs", "relaxBin", "bin_r", "user_bin_r_jobs", {"jobs": 2, "chunk_size": 64}),
+		("relaxBin --watch", "relaxBin", "bin_r", "user_bin_r_watch", {"watch": True}),
+		("rvcBin --rvc", "rvcBin", "bin_c", "user_bin_c", {"rvc": True}),
+	]
+
+	# seconds a single test may take before it is failed
+	TIMEOUT = 10
+	# seconds between checks on the running tests while none has finished
+	POLL_INTERVAL = 0.01
+
+	def __init__(self, verb, enable,operating_system, jobs=None, timeout=None, shard=None, useCache=True):
+		super().__init__(verb, enable,operating_system, shard, useCache)
 		self.enable = enable
-		self.operating_system == operating_system
+		self.operating_system = operating_system
+		self.jobs = jobs or os.cpu_count()
+		if timeout is not None:
+			self.TIMEOUT = timeout
 
-		if self.operating_system == 'linux':
-			self.ASM_RUN_DIR = "../SimpleAssembler/"
-		elif self.operating_system == 'windows':
-			self.ASM_RUN_DIR = "..\SimpleAssembler\\"
+		self.ASM_RUN_DIR = os.path.abspath(os.path.join("..", "SimpleAssembler"))
+		self.TESTS_DIR = os.path.join("tests", "assembly")
 
+	def startPool(self, workers):
+		return multiprocessing.Pool(workers, initWorker, (self.ASM_RUN_DIR,))
 
-	def handleErrorGen(self):
-	
-		curDir = os.getcwd()
-		if self.operating_system == 'linux': 
-			tests = self.listFiles("tests/assembly/" + self.ASM_ERROR_DIR) 
-		elif self.operating_system == 'windows':
-			tests = self.listFiles("tests\\assembly\\" + self.ASM_ERROR_DIR) 
-		os.chdir(self.ASM_RUN_DIR)  
-		
-		for test in tests:
-			self.printSev(self.HIGH, bcolors.OKCYAN + "Running " + test + bcolors.ENDC)
-			python_command = 'python3 Assembler.py'
-			if self.operating_system == 'linux':
-				assembly_file = ' ' + '../automatedTesting/tests/assembly/' + self.ASM_ERROR_DIR + '/' + test
-			elif self.operating_system == 'windows':
-				assembly_file = ' ' + '..\\automatedTesting\\tests\\assembly\\' + self.ASM_ERROR_DIR + '\\' + test
-			
-			# create a temp file
-			if self.operating_system == 'linux':
-				os.system('touch temp_file.txt')
-			elif self.operating_system == 'windows':
-				os.system('cd . > temp_file.txt')	
+	def runTests(self, jobs):
+		# run (inputFile, outputFile) jobs on a worker pool, results come back in job order
+		# a test is only handed out when a worker is free, so its TIMEOUT starts when it starts;
+		# one still running after TIMEOUT seconds gives None, and since a single hung worker cannot
+		# be stopped, the pool is replaced and the other running tests are started again
+		workers = min(self.jobs, max(len(jobs), 1))
+		results = [None] * len(jobs)
+		waiting = collections.deque(range(len(jobs)))
+		running = {}
+		pool = self.startPool(workers)
+		try:
+			while waiting or running:
+				while waiting and len(running) < workers:
+					index = waiting.popleft()
+					running[index] = (pool.apply_async(assembleTest, jobs[index]), time.monotonic() + self.TIMEOUT)
+
+				for index in [index for index, (result, _) in running.items() if result.ready()]:
+					results[index] = running.pop(index)[0].get()
+
+				now = time.monotonic()
+				expired = [index for index, (_, deadline) in running.items() if deadline <= now]
+				if expired:
+					for index in expired:
+						del running[index]
+					# terminate rather than close, so a hung test cannot block the grader
+					pool.terminate()
+					pool.join()
+					waiting.extendleft(sorted(running, reverse=True))
+					running.clear()
+					pool = self.startPool(workers)
+				elif running:
+					result, deadline = min(running.values(), key=lambda entry: entry[1])
+					result.wait(min(deadline - now, self.POLL_INTERVAL))
+		finally:
+			pool.terminate()
+			pool.join()
+		return results
 
-			machine_code_file = ' ' + 'temp_file.txt'
-			command = python_command + assembly_file + machine_code_file
-			errors = os.popen(command).read()
-			if self.operating_system == 'linux':
-				os.system('rm temp_file.txt')
-			elif self.operating_system == 'windows':
-				os.system('del temp_file.txt')
+	def runHere(self, jobs):
+		# run jobs one after another in this process, without the TIMEOUT; for tests that start
+		# a pool of their own, which the (daemonic) workers of runTests cannot
+		if Assembler is None:
+			initWorker(self.ASM_RUN_DIR)
+		return [assembleTest(*job) for job in jobs]
 
+	def handleErrorGen(self):
+
+		testDir = os.path.join(self.TESTS_DIR, self.ASM_ERROR_DIR)
+		tests = sorted(self.listFiles(testDir))
 
+		jobs = [(os.path.abspath(os.path.join(testDir, test)), None) for test in tests]
+		for test, result in zip(tests, self.runTests(jobs)):
+			self.printSev(self.HIGH, bcolors.OKCYAN + "Running " + test + bcolors.ENDC)
+			if result is None:
+				errors = "Timed out after " + str(self.TIMEOUT) + "s\n"
+			else:
+				errors = result[0]
 			self.printSev(self.HIGH, errors, end="")
 			self.printSev(self.HIGH, "============================================\n")
 
-		os.chdir(curDir)
+	def handleBin(self, genDir, expDir, suite=None, userDir=None, options=None):
 
-	def handleBin(self, genDir, expDir):
-		
 		passCount = 0
 		totalCount = 0
-		
-		curDir = os.getcwd()
-		if self.operating_system == 'linux':
-			tests = self.listFiles("tests/assembly/" + genDir)
-		elif self.operating_system == 'windows':
-			tests = self.listFiles("tests\\assembly\\" + genDir)
-		tests.sort()
-		os.chdir(self.ASM_RUN_DIR)
-		
-		for test in tests:
-
-			python_command = 'python3 Assembler.py'
-			if self.operating_system == 'linux':
-				assembly_file = ' ' + '../automatedTesting/tests/assembly/' + genDir + '/' + test
-				machine_code_file = ' ' + '../automatedTesting/tests/assembly/user_' + expDir + '/' + test
-				os.system('touch' + ' ' + machine_code_file)
-			elif self.operating_system == 'windows':
-				assembly_file = ' ' + '..\\automatedTesting\\tests\\assembly\\' + genDir + '\\' + test
-				machine_code_file = ' ' + '..\\automatedTesting\\tests\\assembly\\user_' + expDir + '\\' + test
-				os.system('cd . >' + machine_code_file)
-			command = python_command + assembly_file + machine_code_file
-			os.system(command)
-			generatedBin = open(machine_code_file.strip(),'r').readlines()
-
-			if self.operating_system == 'linux':
-				exact_machine_code_file = "../automatedTesting/tests/assembly/" + expDir + "/" + test
-			elif self.operating_system == 'windows':
-				exact_machine_code_file = "..\\automatedTesting\\tests\\assembly\\" + expDir + "\\" + test
-			expectedBin = open(exact_machine_code_file,'r').readlines()
-			
+		suite = suite or genDir
+
+		testDir = os.path.join(self.TESTS_DIR, genDir)
+		userDir = os.path.join(self.TESTS_DIR, userDir or "user_" + expDir)
+		expectedDir = os.path.join(self.TESTS_DIR, expDir)
+		if not os.path.isdir(testDir):
+			self.printSev(self.HIGH, bcolors.WARNING + "Skipped, no " + testDir + " directory" + bcolors.ENDC)
+			return passCount, totalCount
+		tests = self.listTests(testDir, suite)
+		os.makedirs(userDir, exist_ok=True)
 
-			if self.diff(generatedBin, expectedBin):
+		# tests whose input, expected output, options and assembler sources all match a cached pass are skipped
+		self.loadCache()
+		digest = self.sourceDigest(self.ASM_RUN_DIR) + repr(sorted((options or {}).items()))
+		keys = [self.cacheKey(digest, os.path.join(testDir, test), os.path.join(expectedDir, test)) for test in tests]
+		cached = [self.cachedPass(key) for key in keys]
+
+		jobs = [(os.path.abspath(os.path.join(testDir, test)), os.path.abspath(os.path.join(userDir, test)), options)
+				for test, hit in zip(tests, cached) if not hit]
+		# output left over from an earlier run must not be graded in place of this one's
+		for _, userFile, _ in jobs:
+			if os.path.isfile(userFile):
+				os.remove(userFile)
+		results = iter(self.runHere(jobs) if "jobs" in (options or {}) else self.runTests(jobs))
+
+		for test, key, hit in zip(tests, keys, cached):
+
+			userFile = os.path.join(userDir, test)
+			record = {"suite": suite, "test": test, "passed": False, "cached": hit,
+					"wallTime": 0.0, "asmTime": 0.0, "outputSize": 0}
+			self.records.append(record)
+			totalCount += 1
+
+			if hit:
+				self.printSev(self.HIGH, bcolors.OKGREEN + "[PASSED]" + bcolors.ENDC + " " + test + " (cached)")
+				record["passed"] = True
+				if os.path.isfile(userFile):
+					record["outputSize"] = os.path.getsize(userFile)
+				passCount += 1
+				continue
+
+			result = next(results)
+			if result is None:
+				self.printSev(self.HIGH, bcolors.FAIL + "[TIMEOUT]" + bcolors.ENDC + " " + test)
+				record["wallTime"] = record["asmTime"] = self.TIMEOUT
+				continue
+			diagnostics, record["asmTime"], raised = result
+			self.printSev(self.LOW, diagnostics, end="")
+			if raised or not os.path.isfile(userFile):
+				self.printSev(self.HIGH, bcolors.FAIL + "[FAILED]" + bcolors.ENDC + " " + test
+							  + (" (assembler raised)" if raised else " (no output written)"))
+				record["wallTime"] = record["asmTime"]
+				continue
+
+			start = time.perf_counter()
+			passed = self.diffFiles(userFile, os.path.join(expectedDir, test))
+			record["wallTime"] = record["asmTime"] + time.perf_counter() - start
+			record["outputSize"] = os.path.getsize(userFile)
+			record["passed"] = passed
+			if passed:
 				self.printSev(self.HIGH, bcolors.OKGREEN + "[PASSED]" + bcolors.ENDC + " " + test)
+				self.storePass(key)
 				passCount += 1
 			else:
 				self.printSev(self.HIGH, bcolors.FAIL + "[FAILED]" + bcolors.ENDC + " " + test)
-			totalCount += 1
 
-		os.chdir(curDir)
+		self.saveCache()
 		return passCount, totalCount
 	
-	
+
 	def grade(self):
 		res = None
 		if(self.enable):
@@ -126,6 +248,15 @@ class AsmGrader(Grader):
 
 			self.printSev(self.HIGH, bcolors.OKBLUE + bcolors.BOLD + "\nRunning hard tests" + bcolors.ENDC)
 			hardPass, hardTotal = self.handleBin(self.ASM_HARD_DIR, self.BIN_HARD_DIR)
+
+			self.printSev(self.HIGH, bcolors.OKBLUE + bcolors.BOLD + "\nRunning feature tests" + bcolors.ENDC)
+			featurePass = featureTotal = 0
+			for suite, genDir, expDir, userDir, options in self.FEATURE_SUITES:
+				self.printSev(self.HIGH, bcolors.OKCYAN + suite + bcolors.ENDC)
+				passed, total = self.handleBin(genDir, expDir, suite, userDir, options)
+				featurePass += passed
+				featureTotal += total
+			self.printSev(self.HIGH, "Feature tests passed: " + str(featurePass) + " out of " + str(featureTotal))
 			
 			# uncomment to evaluate error tests
 			# self.printSev(self.HIGH, bcolors.OKBLUE + bcolors.BOLD + "Running error tests" + bcolors.ENDC)
@@ -2,13 +2,37 @@
 from os import listdir
 from os.path import isfile, join
 from colors import bcolors
+import hashlib, json, os, zlib
 
 class Grader:
 	## ---- either 'linux' or 'windows'
 	operating_system = 'windows'
 	verbose = False
 	enable = False
+	# (index, count) to only run this machine's share of the tests
+	shard = None
+
+	# passed test cache, { key : True } with the most recently used key last
+	CACHE_FILE = ".grader_cache.json"
+	CACHE_ENTRIES = 10000
+	useCache = True
 	
+	# Output comparison: characters read per chunk, mismatches reported before giving up
+	CHUNK_SIZE = 65536
+	MAX_MISMATCHES = 1
+
+	# opcode -> (field, high bit, low bit) of that instruction format
+	FIELDS = {
+		"0110011": [("funct7", 31, 25), ("rs2", 24, 20), ("rs1", 19, 15), ("funct3", 14, 12), ("rd", 11, 7), ("opcode", 6, 0)],
+		"0000011": [("imm", 31, 20), ("rs1", 19, 15), ("funct3", 14, 12), ("rd", 11, 7), ("opcode", 6, 0)],
+		"0010011": [("imm", 31, 20), ("rs1", 19, 15), ("funct3", 14, 12), ("rd", 11, 7), ("opcode", 6, 0)],
+		"1100111": [("imm", 31, 20), ("rs1", 19, 15), ("funct3", 14, 12), ("rd", 11, 7), ("opcode", 6, 0)],
+		"0100011": [("imm[11:5]", 31, 25), ("rs2", 24, 20), ("rs1", 19, 15), ("funct3", 14, 12), ("imm[4:0]", 11, 7), ("opcode", 6, 0)],
+		"1100011": [("imm[12|10:5]", 31, 25), ("rs2", 24, 20), ("rs1", 19, 15), ("funct3", 14, 12), ("imm[4:1|11]", 11, 7), ("opcode", 6, 0)],
+		"1101111": [("imm", 31, 12), ("rd", 11, 7), ("opcode", 6, 0)],
+		"default": [("funct7", 31, 25), ("rs2", 24, 20), ("rs1", 19, 15), ("funct3", 14, 12), ("rd", 11, 7), ("opcode", 6, 0)],
+	}
+
 	# Printing severity
 	HIGH = 1 	# Printed even if not verbose
 	LOW = 0
@@ -20,38 +44,143 @@ class Grader:
 	def listFiles(self, dirPath):
 		return [f for f in listdir(dirPath) if isfile(join(dirPath, f))]
 
+	def inShard(self, suite, test):
+		# stable across machines and runs, unlike hash()
+		if self.shard is None:
+			return True
+		index, count = self.shard
+		return zlib.crc32((suite + "/" + test).encode()) % count == index
+
+	def listTests(self, dirPath, suite):
+		return sorted(f for f in self.listFiles(dirPath) if self.inShard(suite, f))
+
+	def loadCache(self):
+		self.cache = {}
+		if self.useCache and isfile(self.CACHE_FILE):
+			try:
+				with open(self.CACHE_FILE, 'r') as fr:
+					self.cache = json.load(fr)
+			except ValueError:
+				self.cache = {}
+
+	def saveCache(self):
+		if not self.useCache:
+			return
+		keys = list(self.cache)[-self.CACHE_ENTRIES:]
+		tmp = self.CACHE_FILE + "." + str(os.getpid())
+		with open(tmp, 'w') as fw:
+			json.dump(dict.fromkeys(keys, True), fw)
+		os.replace(tmp, self.CACHE_FILE)
+
+	def sourceDigest(self, dirPath):
+		# hash of the *.py files of the program under test
+		digest = hashlib.sha256()
+		for f in sorted(self.listFiles(dirPath)):
+			if f.endswith(".py"):
+				digest.update(f.encode())
+				with open(join(dirPath, f), 'rb') as fr:
+					digest.update(fr.read())
+		return digest.hexdigest()
+
+	def cacheKey(self, sourceDigest, *paths):
+		# sources + test input + expected output, None if a file is missing
+		digest = hashlib.sha256(sourceDigest.encode())
+		for path in paths:
+			if not isfile(path):
+				return None
+			with open(path, 'rb') as fr:
+				digest.update(hashlib.sha256(fr.read()).digest())
+		return digest.hexdigest()
+
+	def cachedPass(self, key):
+		if not self.useCache or key is None or key not in self.cache:
+			return False
+		# move to the end, so the least recently used keys are dropped first
+		self.cache[key] = self.cache.pop(key)
+		return True
+
+	def storePass(self, key):
+		if self.useCache and key is not None:
+			self.cache[key] = True
+
 
 	def diff(self, lines1, lines2):
-		lines1Clean = []
-		lines2Clean = []
+		return self.compare(enumerate(lines1, 1), enumerate(lines2, 1))
+
+	def diffFiles(self, generatedPath, expectedPath):
+		# streams both files, so nothing is held beyond one chunk per file
+		with open(generatedPath, 'r') as generated, open(expectedPath, 'r') as expected:
+			return self.compare(self.readLines(generated), self.readLines(expected))
+
+	def readLines(self, f):
+		# (line number, line) pairs, read CHUNK_SIZE characters at a time
+		lineNum = 0
+		rest = ""
+		while True:
+			chunk = f.read(self.CHUNK_SIZE)
+			if not chunk:
+				break
+			lines = (rest + chunk).split("\n")
+			rest = lines.pop()
+			for line in lines:
+				lineNum += 1
+				yield lineNum, line
+		if rest:
+			yield lineNum + 1, rest
+
+	def nonBlank(self, numbered):
+		for lineNum, line in numbered:
+			line = line.strip()
+			if line != "":
+				yield lineNum, line
+
+	def compare(self, generated, expected):
+		# blank lines are skipped on both sides, stops after MAX_MISMATCHES mismatches
+		generated = self.nonBlank(generated)
+		expected = self.nonBlank(expected)
+		mismatches = 0
 
-		for l in lines1:
-			if l.strip() != "":
-				lines1Clean.append(l.strip())
+		while True:
+			genNum, genLine = next(generated, (None, None))
+			expNum, expLine = next(expected, (None, None))
+			if genLine is None and expLine is None:
+				break
+			if genLine == expLine:
+				continue
 
-		for l in lines2:
-			if l.strip() != "":
-				lines2Clean.append(l.strip())
+			lineNum = expNum if expNum is not None else genNum
+			self.printSev(self.LOW, bcolors.FAIL + "Mismatch at line " + str(lineNum) +  "." + bcolors.ENDC)
+			self.printSev(self.LOW, "    expected: " + (expLine if expLine is not None else "<end of file>"))
+			self.printSev(self.LOW, "    actual:   " + (genLine if genLine is not None else "<end of file>"))
+			fields = self.fieldDiff(genLine, expLine)
+			if fields:
+				self.printSev(self.LOW, "    differs in: " + ", ".join(fields))
 
-		match = True
+			mismatches += 1
+			if mismatches >= self.MAX_MISMATCHES:
+				break
 
-		# Match Size
-		if(len(lines1Clean) > len(lines2Clean)):
-			lines2Clean += [""] * (len(lines1Clean) - len(lines2Clean))
-		elif(len(lines2Clean) > len(lines1Clean)):
-			lines1Clean += [""] * (len(lines2Clean) - len(lines1Clean))
+		return mismatches == 0
 
-		for lineNum, lines in enumerate(zip(lines1Clean, lines2Clean), 1):
-			if(lines[0] != lines[1]):
-				self.printSev(self.LOW, bcolors.FAIL + "Mismatch at line " + str(lineNum) +  "." + bcolors.ENDC)
-				match &= False
+	def fieldDiff(self, genLine, expLine):
+		# names of the instruction fields that differ, when both lines are 32 bit machine code
+		if genLine is None or expLine is None or len(genLine) != 32 or len(expLine) != 32:
+			return []
+		if set(genLine + expLine) - set("01"):
+			return []
 
-		return match
+		fields = self.FIELDS.get(expLine[25:], self.FIELDS["default"])
+		return [name for name, hi, lo in fields if genLine[31 - hi:32 - lo] != expLine[31 - hi:32 - lo]]
 
-	def __init__(self, verb, enable,operating_system):
+	def __init__(self, verb, enable,operating_system, shard=None, useCache=True):
 		self.verbose = verb
 		self.enable = enable
 		self.operating_system = operating_system
+		self.shard = shard
+		self.useCache = useCache
+		self.cache = {}
+		# one {"suite", "test", "passed", "cached"} entry per test run
+		self.records = []
 	
 	def grade(self):
 		raise NotImplementedError("Please Implement this method")
\ No newline at end of file
@@ -1,12 +1,18 @@
 # Result generator class
 
 from colors import bcolors
+import json
+import xml.etree.ElementTree as ET
 
 class Results:
 
 	VERBOSE = False
 	asmRes = None
 	simRes = None
+	# number of results taken from the grader's passed test cache
+	cached = 0
+	# baseline tests faster than this (seconds) are too noisy to flag as regressions
+	MIN_REGRESSION_TIME = 0.001
 
 
 	def declareARes(self, res):
@@ -16,14 +22,14 @@ class Results:
 		totalMarks = 0
 		for suite in res:
 			print(suite[0], end=": ")
-			print("Marks =", suite[1] * suite[-1], "out of", suite[2] * suite[-1])
+			print("Marks =", round(suite[1] * suite[-1], 4), "out of", round(suite[2] * suite[-1], 4))
 			if(self.VERBOSE):
 				print("Passed", suite[1], "out of", suite[2], "tests")
 
 			totalMarksGained += suite[1] * suite[-1]
 			totalMarks += suite[2] * suite[-1]
 
-		print(bcolors.BOLD + bcolors.OKGREEN + "Total: " + str(totalMarksGained) + " out of " + str(totalMarks))
+		print(bcolors.BOLD + bcolors.OKGREEN + "Total: " + str(round(totalMarksGained, 4)) + " out of " + str(round(totalMarks, 4)))
 		print(bcolors.ENDC, end="")
 
 	def declare(self):
@@ -34,6 +40,87 @@ class Results:
 		if(self.simRes):
 			print("Simulator ===>")
 			self.declareARes(self.simRes)
+		if(self.cached):
+			print(bcolors.OKCYAN + str(self.cached) + " result(s) taken from cache (--no-cache to rerun them)" + bcolors.ENDC)
+
+	def save(self, path, records=None):
+		# per-shard result file, combined later with merge()
+		with open(path, 'w') as fw:
+			json.dump({"asmRes": self.asmRes, "simRes": self.simRes, "records": records or []}, fw, indent=1)
+
+	def saveJUnit(self, path, records):
+		# one <testsuite> per suite directory, timing and output size as testcase properties
+		suites = {}
+		for record in records:
+			suites.setdefault(record["suite"], []).append(record)
+
+		root = ET.Element("testsuites")
+		for suite, tests in suites.items():
+			failures = sum(1 for record in tests if not record["passed"])
+			suiteTime = sum(record.get("wallTime", 0.0) for record in tests)
+			suiteElem = ET.SubElement(root, "testsuite", name=suite, tests=str(len(tests)),
+					failures=str(failures), time="%.6f" % suiteTime)
+			for record in tests:
+				case = ET.SubElement(suiteElem, "testcase", classname=suite, name=record["test"],
+						time="%.6f" % record.get("wallTime", 0.0))
+				properties = ET.SubElement(case, "properties")
+				for key in ("asmTime", "simTime", "outputSize", "cached"):
+					if key in record:
+						ET.SubElement(properties, "property", name=key, value=str(record[key]))
+				if not record["passed"]:
+					ET.SubElement(case, "failure", message="output does not match expected output")
+
+		ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+
+	def compareBaseline(self, records, baselinePath, maxSlowdown):
+		# flags tests whose assembler time grew by more than maxSlowdown percent over a saved --results file
+		with open(baselinePath, 'r') as fr:
+			baseline = {(record["suite"], record["test"]): record for record in json.load(fr)["records"]}
+
+		regressions = 0
+		for record in records:
+			old = baseline.get((record["suite"], record["test"]))
+			if old is None or record.get("cached") or old.get("cached") or "asmTime" not in record:
+				continue
+			if old.get("asmTime", 0.0) < self.MIN_REGRESSION_TIME:
+				continue
+			slowdown = 100.0 * (record["asmTime"] - old["asmTime"]) / old["asmTime"]
+			if slowdown > maxSlowdown:
+				regressions += 1
+				print(bcolors.FAIL + "[SLOWER] " + record["suite"] + "/" + record["test"] + ": "
+						+ "%.2fms -> %.2fms (%+.0f%%)" % (1000 * old["asmTime"], 1000 * record["asmTime"], slowdown)
+						+ bcolors.ENDC)
+
+		if regressions:
+			print(bcolors.FAIL + str(regressions) + " test(s) slower than baseline by more than " + str(maxSlowdown) + "%" + bcolors.ENDC)
+		else:
+			print(bcolors.OKGREEN + "No assembler time regressions against " + baselinePath + bcolors.ENDC)
+		return regressions
+
+	@staticmethod
+	def mergeRes(resList):
+		# add up passed/total per suite, keeping the suite order of the first file that has it
+		merged = {}
+		for res in resList:
+			for name, passed, total, marks in res or []:
+				if name in merged:
+					merged[name][1] += passed
+					merged[name][2] += total
+				else:
+					merged[name] = [name, passed, total, marks]
+		return list(merged.values()) or None
+
+	@classmethod
+	def merge(cls, verb, paths):
+		shards = []
+		for path in paths:
+			with open(path, 'r') as fr:
+				shards.append(json.load(fr))
+		asmRes = cls.mergeRes([shard["asmRes"] for shard in shards])
+		simRes = cls.mergeRes([shard["simRes"] for shard in shards])
+		res = cls(verb, asmRes, simRes)
+		res.cached = sum(1 for shard in shards for record in shard["records"] if record.get("cached"))
+		return res
 
 	def __init__(self, verb, asmRes, simRes):
 		self.VERBOSE = verb
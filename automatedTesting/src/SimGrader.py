@@ -3,7 +3,7 @@
 from colors import bcolors
 
 from Grader import Grader
-import os
+import os, time
 
 class SimGrader(Grader):
 
@@ -19,8 +19,8 @@ class SimGrader(Grader):
 	TRACE_SIMPLE_DIR = "simple"
 
 
-	def __init__(self, verb, enable,operating_system):
-		super().__init__(verb, enable,operating_system)
+	def __init__(self, verb, enable,operating_system, shard=None):
+		super().__init__(verb, enable,operating_system, shard)
 		self.enable = enable
 		self.operating_system = operating_system
 		
@@ -36,10 +36,9 @@ class SimGrader(Grader):
 		
 		curDir = os.getcwd()
 		if self.operating_system == 'linux':
-			tests = self.listFiles("tests/bin/" + genDir)
+			tests = self.listTests("tests/bin/" + genDir, genDir)
 		elif self.operating_system == 'windows':
-			tests = self.listFiles("tests\\bin\\" + genDir)
-		tests.sort()
+			tests = self.listTests("tests\\bin\\" + genDir, genDir)
 		os.chdir(self.SIM_RUN_DIR)
 		
 		for test in tests:
@@ -52,22 +51,24 @@ class SimGrader(Grader):
 				machine_code_file = ' ' + '..\\automatedTesting\\tests\\bin\\' + genDir + '\\' + test
 				output_trace_file = ' ' + '..\\automatedTesting\\tests\\user_traces\\' + genDir + '\\' + test
 			command = python_command + machine_code_file + output_trace_file
+			start = time.perf_counter()
 			os.system(command)
-			
-			
-			generatedTrace = open(output_trace_file.strip(),'r').readlines()
+			simTime = time.perf_counter() - start
 
 			if self.operating_system == 'linux':
 				exact_trace_file = "../automatedTesting/tests/traces/" + expDir + "/" + test
 			elif self.operating_system == 'windows':
 				exact_trace_file = "..\\automatedTesting\\tests\\traces\\" + expDir + "\\" + test
-			expectedTrace = open(exact_trace_file,'r').readlines()
 
-			if self.diff(generatedTrace, expectedTrace):
+			passed = self.diffFiles(output_trace_file.strip(), exact_trace_file)
+			if passed:
 				self.printSev(self.HIGH, bcolors.OKGREEN + "[PASSED]" + bcolors.ENDC + " " + test)
 				passCount += 1
 			else:
 				self.printSev(self.HIGH, bcolors.FAIL + "[FAILED]" + bcolors.ENDC + " " + test)
+			self.records.append({"suite": genDir, "test": test, "passed": passed, "cached": False,
+					"wallTime": time.perf_counter() - start, "simTime": simTime,
+					"outputSize": os.path.getsize(output_trace_file.strip())})
 			totalCount += 1
 
 		os.chdir(curDir)
@@ -10,6 +10,15 @@ from Results import Results
 VERBOSE = False
 GRADE_ASSEMBLER = True
 GRADE_SIMULATOR = True
+JOBS = None
+TIMEOUT = None
+SHARD = None
+RESULTS_FILE = None
+USE_CACHE = True
+MAX_MISMATCHES = None
+JUNIT_FILE = None
+BASELINE_FILE = None
+MAX_SLOWDOWN = 20.0
 
 def printHelp():
 	print('----Please enter in correct format----')
@@ -18,6 +27,16 @@ def printHelp():
 	print("--no-sim to not grade simulator")
 	print("--linux for Linux operating system")
 	print("--windows for windows operating system")
+	print("--jobs=N to run N assembler tests at a time (default: number of CPUs)")
+	print("--timeout=S to fail an assembler test that takes longer than S seconds")
+	print("--shard=i/N to only grade shard i (0 based) of N, for spreading grading over machines")
+	print("--results=FILE to save this run's results as JSON (per-test pass/fail, times, output size)")
+	print("--junit=FILE to save this run's results as JUnit XML")
+	print("--baseline=FILE to flag tests whose assembler time regressed against a saved --results file")
+	print("--max-slowdown=PCT allowed assembler time increase before a test is flagged (default 20)")
+	print("--merge FILE... to combine saved result files into the final report")
+	print("--mismatches=K to report up to K mismatching lines per failed test (default 1)")
+	print("--no-cache to rerun assembler tests that passed before with unchanged inputs and sources")
 	print("Example_linux: $python3 src/main.py --linux --no-sim")
 	print("Example_windows: >python3 src\main.py --windows --no-sim")
 
@@ -26,6 +45,15 @@ def setupArgs():
 	global GRADE_ASSEMBLER
 	global GRADE_SIMULATOR
 	global OPERATING_SYSTEM
+	global JOBS
+	global TIMEOUT
+	global SHARD
+	global RESULTS_FILE
+	global USE_CACHE
+	global MAX_MISMATCHES
+	global JUNIT_FILE
+	global BASELINE_FILE
+	global MAX_SLOWDOWN
 
 	if len(sys.argv) < 3:
 		printHelp()
@@ -40,22 +68,59 @@ def setupArgs():
 			GRADE_SIMULATOR = False
 		elif ((arg == "--linux") | (arg == "--windows")):
 			OPERATING_SYSTEM = arg[2:]
+		elif arg.startswith("--jobs="):
+			JOBS = int(arg[len("--jobs="):])
+		elif arg.startswith("--timeout="):
+			TIMEOUT = float(arg[len("--timeout="):])
+		elif arg.startswith("--shard="):
+			index, count = arg[len("--shard="):].split("/")
+			SHARD = (int(index), int(count))
+			if not 0 <= SHARD[0] < SHARD[1]:
+				printHelp()
+				exit()
+		elif arg.startswith("--mismatches="):
+			MAX_MISMATCHES = int(arg[len("--mismatches="):])
+		elif arg == "--no-cache":
+			USE_CACHE = False
+		elif arg.startswith("--results="):
+			RESULTS_FILE = arg[len("--results="):]
+		elif arg.startswith("--junit="):
+			JUNIT_FILE = arg[len("--junit="):]
+		elif arg.startswith("--baseline="):
+			BASELINE_FILE = arg[len("--baseline="):]
+		elif arg.startswith("--max-slowdown="):
+			MAX_SLOWDOWN = float(arg[len("--max-slowdown="):])
 		else:
 			printHelp()
 			exit()
 			# break
 
 def main():
+	if len(sys.argv) > 2 and sys.argv[1] == "--merge":
+		Results.merge(VERBOSE, sys.argv[2:]).declare()
+		return
+
 	setupArgs()
 
-	asmGrader = AsmGrader(VERBOSE, GRADE_ASSEMBLER,OPERATING_SYSTEM)
-	simGrader = SimGrader(VERBOSE, GRADE_SIMULATOR,OPERATING_SYSTEM)
+	asmGrader = AsmGrader(VERBOSE, GRADE_ASSEMBLER,OPERATING_SYSTEM, JOBS, TIMEOUT, SHARD, USE_CACHE)
+	simGrader = SimGrader(VERBOSE, GRADE_SIMULATOR,OPERATING_SYSTEM, SHARD)
+	if MAX_MISMATCHES:
+		asmGrader.MAX_MISMATCHES = simGrader.MAX_MISMATCHES = MAX_MISMATCHES
 
 	asmRes = asmGrader.grade()
 	simRes = simGrader.grade()	
 
 	res = Results(VERBOSE, asmRes, simRes)
+	records = asmGrader.records + simGrader.records
+	res.cached = sum(1 for record in records if record["cached"])
+	if RESULTS_FILE:
+		res.save(RESULTS_FILE, records)
+	if JUNIT_FILE:
+		res.saveJUnit(JUNIT_FILE, records)
 	res.declare()
+
+	if BASELINE_FILE and res.compareBaseline(records, BASELINE_FILE, MAX_SLOWDOWN):
+		exit(1)
 	
 
 if __name__ == '__main__':